@@ -0,0 +1,108 @@
+import threading
+import time
+from pathlib import Path
+
+from motion_clip import MotionClip, find_clip
+
+
+class ActionLibrary:
+    """启动时在后台线程一次性加载 ACTION_MAP 中的全部动作，之后常驻内存。
+
+    get() 从不阻塞：动作尚未加载完成时返回 None，渲染线程不再做任何文件 I/O。
+    动作按文件名（如 "greet"）索引，也接受 ACTION_MAP 中的中文名和 "actions/greet.json" 形式的路径。
+    """
+
+    def __init__(self, action_map, action_dir="actions", elbow_dy=15, memory_budget=64 * 1024 * 1024, priority=()):
+        self.action_map = dict(action_map)
+        self.action_dir = Path(action_dir)
+        self.elbow_dy = elbow_dy
+        self.memory_budget = memory_budget
+        self.load_times = {}
+        self.missing = set()
+        self._clips = {}
+        # priority 中的动作（如 Idle）最先加载，其余按 action_map 顺序
+        names = [self.action_map.get(k) for k in priority] + list(self.action_map.values())
+        self._events = {name: threading.Event() for name in names if name}
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load_all, name="ActionLibrary", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load_all(self):
+        start = time.perf_counter()
+        for name, event in self._events.items():
+            path = find_clip(self.action_dir, name)
+            t0 = time.perf_counter()
+            try:
+                if path is None:
+                    raise FileNotFoundError(self.action_dir / f"{name}.json")
+                clip = MotionClip.load(path).apply_fixups(elbow_dy=self.elbow_dy)
+                if not len(clip):
+                    raise ValueError("没有帧数据")
+                self._clips[name] = clip
+                self.load_times[name] = time.perf_counter() - t0
+            except Exception as e:
+                print(f"[WARN] 动作 '{name}' 加载失败，将忽略: {e}")
+                self.missing.add(name)
+            finally:
+                event.set()
+        self.load_times["__total__"] = time.perf_counter() - start
+        self._done.set()
+
+        report = self.report()
+        print(f"[ActionLibrary] 已加载 {len(self._clips)} 个动作，共 {report['memory_bytes'] / 1024:.1f} KB，"
+              f"耗时 {report['load_times']['__total__'] * 1000:.1f} ms")
+        if report["memory_bytes"] > self.memory_budget:
+            print(f"[WARN] 动作库内存 {report['memory_bytes']} 字节超出预算 {self.memory_budget} 字节。")
+
+    def resolve(self, action):
+        """把中文动作名、文件名或路径统一为动作库的键，无法识别时返回 None。"""
+        action = action.strip().strip("'\"")
+        if action in self.action_map:
+            return self.action_map[action] or None
+        stem = Path(action).stem
+        return stem if stem in self._events else None
+
+    def get(self, action):
+        key = self.resolve(action)
+        return self._clips.get(key) if key else None
+
+    def is_loading(self, action):
+        key = self.resolve(action)
+        return key is not None and not self._events[key].is_set()
+
+    def wait(self, action, timeout=None):
+        """阻塞等待某个动作加载完成，仅用于启动阶段。"""
+        key = self.resolve(action)
+        if key is None:
+            return None
+        self._events[key].wait(timeout)
+        return self._clips.get(key)
+
+    def wait_all(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def sequence(self, actions, w, h, blend_frames=0):
+        """拼接多个已加载的动作并以首帧骨盆居中，返回新的 MotionClip。"""
+        clips = [self.get(a) for a in actions]
+        clips = [c for c in clips if c is not None]
+        clip = MotionClip.stitch(clips, blend_frames=blend_frames)
+        if len(clip) and not clip.center_pelvis(w // 2, h // 2):
+            print("[WARN] 首段动作的第一帧没有 'pelvis' 关节，无法居中。")
+        return clip
+
+    def memory_bytes(self):
+        return sum(clip.nbytes for clip in self._clips.values())
+
+    def report(self):
+        return {
+            "loaded": sorted(self._clips),
+            "missing": sorted(self.missing),
+            "memory_bytes": self.memory_bytes(),
+            "memory_budget": self.memory_budget,
+            "load_times": dict(self.load_times),
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+
+# 当前请求提交到线程池的调用，由 _guarded 在任务自己的上下文中设置
+_request_threads = contextvars.ContextVar("request_threads", default=None)
+
+
+class _TrackingExecutor(concurrent.futures.ThreadPoolExecutor):
+    """asyncio.to_thread / run_in_executor 使用的线程池，把提交的调用登记到所属请求上。"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = super().submit(fn, *args, **kwargs)
+        pending = _request_threads.get()
+        if pending is not None:
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+        return future
+
+
+class AgentWorker:
+    """长驻的 Agent 工作线程，持有唯一的事件循环。
+
+    其他线程通过 submit() 提交请求，返回 concurrent.futures.Future。
+    max_concurrency 限制同时进行的请求数；supersede=True 时新请求会取消尚未完成的旧请求，
+    避免连续输入在同一个 Ollama 实例上堆积并行调用。
+    取消只能中断协程，已经在线程中执行的阻塞调用（如 initiate_chat）会继续运行，
+    因此请求占用的并发名额要等它提交的线程调用全部返回后才释放。
+    """
+
+    def __init__(self, handler, max_concurrency=1, supersede=True, max_threads=4):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.supersede = supersede
+        self.max_threads = max_threads
+        self.submitted = 0
+        self.superseded = 0
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._semaphore = None
+        self._tasks = set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="AgentWorker", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        # asyncio.to_thread 使用的线程池，数量固定，不再随请求增长
+        self._loop.set_default_executor(
+            _TrackingExecutor(max_workers=self.max_threads, thread_name_prefix="AgentIO")
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+            self._loop.close()
+
+    async def _guarded(self, *args):
+        async with self._semaphore:
+            threads = set()
+            _request_threads.set(threads)
+            try:
+                return await self.handler(*args)
+            finally:
+                await self._wait_threads(threads)
+
+    @staticmethod
+    async def _wait_threads(threads):
+        # 请求已被取消时再次收到的取消也要忽略，否则名额会在线程返回前释放
+        while threads:
+            try:
+                await asyncio.wait([asyncio.wrap_future(f) for f in list(threads)])
+            except asyncio.CancelledError:
+                pass
+
+    def _schedule(self, future, args):
+        if self.supersede:
+            for task in list(self._tasks):
+                self._tasks.discard(task)
+                if not task.done():
+                    task.cancel()
+                    self.superseded += 1
+        task = self._loop.create_task(self._guarded(*args))
+        self._tasks.add(task)
+
+        def done(t):
+            self._tasks.discard(t)
+            if future.cancelled():
+                return
+            if t.cancelled():
+                future.cancel()
+            elif t.exception() is not None:
+                future.set_exception(t.exception())
+            else:
+                future.set_result(t.result())
+
+        task.add_done_callback(done)
+
+    def submit(self, *args):
+        """线程安全地提交一个请求，返回 concurrent.futures.Future。"""
+        self.start()
+        future = concurrent.futures.Future()
+        self.submitted += 1
+        self._loop.call_soon_threadsafe(self._schedule, future, args)
+        return future
+
+    def cancel_all(self):
+        def cancel():
+            for task in list(self._tasks):
+                task.cancel()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(cancel)
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self.cancel_all()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "superseded": self.superseded,
+            "in_flight": len(self._tasks),
+        }
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import struct
+from pathlib import Path
+
+from motion_clip import JOINT_NAMES, META_SUFFIX, joints_to_array
+
+HEADER_WIDTH = 1024      # 文本格式首行的最小字节数，结束时原位改写 video_info
+HEADER_SLACK = 256       # video_info 较大时在其长度之外为结束时新增的字段预留的字节数
+NPY_HEADER_SIZE = 128    # .npy 头部固定字节数，结束时改写帧数
+FLUSH_EVERY = 30         # 每写入多少帧刷新一次缓冲区
+
+
+class FrameWriter:
+    """把采样结果逐帧写入磁盘，内存占用与视频长度无关。
+
+    按扩展名选择格式：
+      .json   紧凑 JSON，首行 video_info，之后每帧一行；
+      .jsonl  JSON Lines，首行 {"video_info": ...}，之后每帧一行；
+      .npy    (帧数, 关节数, 2) float32 数组，video_info 写入同名 .meta.json。
+    写入过程中数据在 <输出>.part 中，close() 时改写头部并重命名为最终文件。
+    未正常关闭的 .json / .jsonl 文件可用 resume=True 续写：丢弃末尾不完整的一行，
+    frames_written / next_source_frame 给出已完成的进度。
+    """
+
+    def __init__(self, path, video_info, resume=False, flush_every=FLUSH_EVERY):
+        self.path = Path(path)
+        self.format = self.path.suffix.lstrip(".")
+        if self.format not in ("json", "jsonl", "npy"):
+            raise ValueError(f"不支持的输出格式: {self.path.suffix}")
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        self.video_info = dict(video_info)
+        self.flush_every = flush_every
+        self.frames_written = 0
+        self.next_source_frame = 0
+        self.header_width = HEADER_WIDTH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        if resume and self.format != "npy" and self._resume():
+            return
+        self._file = open(self.part_path, "wb")
+        if self.format == "npy":
+            self._file.write(self._npy_header(0))
+        else:
+            self.header_width = max(HEADER_WIDTH, len(self._header_data()) + HEADER_SLACK)
+            self._file.write(self._header_line())
+            if self.format == "json":
+                self._file.write(b'"frames": [\n')
+
+    def _header_data(self):
+        info = json.dumps(self.video_info, ensure_ascii=False, separators=(",", ":"))
+        return (f'{{"video_info":{info}' + (',' if self.format == "json" else '}')).encode("utf-8")
+
+    def _header_line(self, width=None):
+        data = self._header_data()
+        width = width or self.header_width
+        if len(data) >= width:
+            raise ValueError(f"video_info 超出头部预留的 {width} 字节")
+        # JSON 允许空白，用空格补齐到固定宽度，结束时可原位改写
+        return data + b" " * (width - len(data) - 1) + b"\n"
+
+    @staticmethod
+    def _npy_header(count):
+        header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d, 2), }" % (count, len(JOINT_NAMES))
+        header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def _resume(self):
+        """从已有的 .part 文件续写，头部与当前视频不一致时返回 False 重新开始。"""
+        try:
+            f = open(self.part_path, "r+b")
+        except FileNotFoundError:
+            return False
+        header = f.readline()
+        try:
+            old_info = json.loads(header.decode("utf-8").rstrip().rstrip(",") + ("}" if self.format == "json" else ""))
+        except ValueError:
+            f.close()
+            return False
+        if len(header) < HEADER_WIDTH or old_info.get("video_info") != self.video_info:
+            f.close()
+            return False
+        self.header_width = len(header)
+        if self.format == "json":
+            f.readline()  # "frames": [
+        end = f.tell()
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            # 写完 ]} 之后、重命名之前崩溃时，末尾是结束符而不是帧
+            try:
+                frame = json.loads(line.lstrip(b","))
+            except ValueError:
+                break
+            if not isinstance(frame, dict) or "joints" not in frame:
+                break
+            self.frames_written += 1
+            self.next_source_frame = frame.get("source_frame", self.next_source_frame) + 1
+            end += len(line)
+        # 丢弃崩溃时写了一半的最后一行
+        f.seek(end)
+        f.truncate()
+        self._file = f
+        return True
+
+    def write(self, frame):
+        """写入一帧；frame 为 {"frame_number", "timestamp", "joints", "source_frame"} 字典。"""
+        if self.format == "npy":
+            self._file.write(joints_to_array(frame["joints"]).tobytes())
+        else:
+            prefix = b"," if self.format == "json" and self.frames_written else b""
+            self._file.write(prefix + json.dumps(frame, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        self.frames_written += 1
+        self.next_source_frame = frame.get("source_frame", self.next_source_frame) + 1
+        if self.frames_written % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self, **final_info):
+        """写完尾部、改写头部（并入 final_info），然后原子地重命名为最终文件。"""
+        self.video_info.update(final_info)
+        if self.format == "json":
+            self._file.write(b"]}\n")
+        if self.format == "npy":
+            self._file.seek(0)
+            self._file.write(self._npy_header(self.frames_written))
+        elif len(self._header_data()) < self.header_width:
+            self._file.seek(0)
+            self._file.write(self._header_line())
+        else:
+            self._rewrite_header()
+        self._file.close()
+        if self.format == "npy":
+            meta_path = self.path.with_suffix(META_SUFFIX)
+            tmp = meta_path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"video_info": self.video_info, "joints": JOINT_NAMES}, f, ensure_ascii=False)
+            os.replace(tmp, meta_path)
+        os.replace(self.part_path, self.path)
+
+    def _rewrite_header(self):
+        """video_info 超出预留宽度时无法原位改写，复制一份带新头部的文件。"""
+        width = len(self._header_data()) + HEADER_SLACK
+        tmp = self.part_path.with_name(self.part_path.name + ".tmp")
+        self._file.close()
+        with open(self.part_path, "rb") as src, open(tmp, "wb") as out:
+            src.seek(self.header_width)
+            out.write(self._header_line(width))
+            shutil.copyfileobj(src, out)
+        os.replace(tmp, self.part_path)
+        self.header_width = width
+
+    def abort(self):
+        """异常退出时保留 .part 文件，以便之后续写。"""
+        self._file.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
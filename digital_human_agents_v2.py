@@ -1,23 +1,59 @@
 import autogen
+import openai
 import re
 import asyncio
 import time
-from typing import Dict, List, Tuple
+import statistics
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from functools import lru_cache
 import logging
 
+from http_pool import PooledHttpClient
+from intent_matcher import IntentMatcher
+from response_cache import ResponseCache
+
+# /v1 接口的请求不带 keep_alive，Ollama 会把模型过期时间重置为默认的 5 分钟
+OLLAMA_DEFAULT_KEEP_ALIVE = 300
+
 class DigitalHumanAgentSystem:
-    def __init__(self, action_mapping: Dict[str, str]):
+    def __init__(self, action_mapping: Dict[str, str], single_call: bool = False,
+                 response_cache: Optional[ResponseCache] = None, fast_path: bool = True,
+                 keep_alive: str = "30m", keep_alive_interval: Optional[float] = 240):
         self.action_mapping = {k.strip().lower(): v for k, v in action_mapping.items()}
+        # single_call=True 时一次 LLM 调用同时产出动作、回复文本和情景理解
+        self.single_call = single_call
+        # 常见问题直接返回缓存的 (动作, 文本)，不再请求 LLM
+        self.response_cache = response_cache
+        # 明显的动作指令在本地解析，跳过动作 Agent
+        self.intent_matcher = IntentMatcher(self.action_mapping.keys()) if fast_path else None
+        self.latencies = {
+            mode: deque(maxlen=200)
+            for mode in ("two_agent", "single_call", "stream", "stream_first_text", "cold", "warm", "warm_up")
+        }
+        # Ollama 模型常驻：启动时预热，之后定期保活。
+        # 通过 /v1 接口的请求会把模型的过期时间重置为 Ollama 默认的 5 分钟，
+        # 因此 keep_alive_interval 应小于 5 分钟。
+        self.keep_alive = keep_alive
+        self.keep_alive_interval = keep_alive_interval
+        # 模型预计被 Ollama 卸载的时刻（time.monotonic），由最近一次预热或 /v1 请求决定
+        self._model_expiry = None
+        self._keep_alive_stop = threading.Event()
+        self._keep_alive_thread = None
+        # 两个 Agent、流式客户端和预热/保活共用一个 keep-alive 连接池，避免每次请求重新建连
+        self.http_client = PooledHttpClient(timeout=30)
         self.llm_config = {
             "config_list": [{
                 "model": "gemma3:4b",
 #                "model":"llama3.1:latest",
                 "base_url": "http://127.0.0.1:11434/v1/",
                 "api_key": "ollama",
+                "http_client": self.http_client,
             }],
             "timeout": 30
         }
+        self._stream_client = None
         self._init_agents()
         self._setup_logger()
 
@@ -180,6 +216,47 @@ action_map = {{
 """
         )
 
+        # 单次调用 Agent：动作在前，便于尽早开始播放
+        self.combined_agent = autogen.AssistantAgent(
+            name="combined_generator",
+            llm_config={**self.llm_config, "temperature": 0.3},
+            max_consecutive_auto_reply=1,
+            system_message=f"""传统皮影戏数字人应答规范（单次输出动作与文本）：
+
+一、输出格式
+严格遵循：动作：[动作名称]</ACTION>[文本内容]</STYLE>[情景理解]</STYLE>
+1. 动作只能从可用动作中挑选，不要自造动作：{list(self.action_mapping.keys())}
+2. 连续多组动作写作 动作：[向前走][行礼]，最多三个
+3. 文本内容遵循严肃的标准汉语风格，不超过100字，直接给出最终回答
+4. 情景理解为对当前用户意图的抽象概述
+
+二、动作选择
+1. 询问名字、询问技能：[拱手礼]
+2. 询问历史渊源、制作工艺、演出时间、工艺难点、剧目推荐等知识性问题：[常态]
+3. 请求展示舞蹈：[跳舞]
+4. 明确的动作指令按顺序输出对应动作，例如 向前走、行礼、向后走、拱手礼
+5. 请求展示皮影技艺：[向前走][行礼][跳舞]
+
+三、示例
+用户输入：“你是谁？”
+输出：动作：[拱手礼]</ACTION>您好，我是皮影戏数字人，擅长表演与制作，很高兴为您服务</STYLE>用户正在询问我的名字</STYLE>
+
+用户输入：“皮影起源是什么？”
+输出：动作：[常态]</ACTION>皮影源于汉代，经历唐宋晋变革与民间创新，至今已有两千多年历史</STYLE>用户正在询问皮影艺术的历史渊源</STYLE>
+
+用户输入：“你能为我跳个舞吗？”
+输出：动作：[跳舞]</ACTION>好的，请看我在灯光与音乐中翩翩起舞，生动传情，这就是皮影戏的表演</STYLE>用户正在请求我展示舞蹈技能</STYLE>
+
+用户输入：“请你向前走两步，行个礼，再向后走两步”
+输出：动作：[向前走][行礼][向后走]</ACTION>好的，我将按您的指令执行动作</STYLE>用户正在请求具体的动作指令：向前走，行礼，向后走</STYLE>
+
+四、最后请你验证流程
+1. 检查是否以 动作：[...]</ACTION> 开头且方括号闭合
+2. 检查是否包含 </STYLE>情景理解</STYLE>
+3. 禁止添加任何解释性文字
+"""
+        )
+
         # User Agent
         self.user_proxy = autogen.UserProxyAgent(
             name="user_proxy",
@@ -198,51 +275,341 @@ action_map = {{
         return self.action_mapping.get(clean)
 
     async def process_input(self, user_input: str) -> Tuple[List[str], str]:
-        try:
-            #generate text
-            await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.user_proxy.initiate_chat,
-                    self.text_agent,
-                    message=user_input,
-                    clear_history=True
-                ),
-                timeout=60
-            )
-            raw_text = self.user_proxy.chat_messages[self.text_agent][-1]["content"]
-            text_response = self._validate_text_response(raw_text)
-
-            #generate action
-            await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.user_proxy.initiate_chat,
-                    self.action_agent,
-                    message=text_response,
-                    clear_history=True
-                ),
-                timeout=10
-            )
-            raw_action = self.user_proxy.chat_messages[self.action_agent][-1]["content"]
-            actions = self._parse_actions(raw_action)
+        cached = self._cache_get(user_input)
+        if cached is not None:
+            return cached
 
-            final_text = re.sub(r"</?STYLE>.*", "", text_response, flags=re.DOTALL).strip()
-            return actions, final_text
+        mode = "single_call" if self.single_call else "two_agent"
+        model_state = self._model_state()
+        start = time.perf_counter()
+        try:
+            if self.single_call:
+                result, parsed = await self._process_single_call(user_input)
+            else:
+                result, parsed = await self._process_two_agent(user_input)
 
         except asyncio.TimeoutError:
             self.logger.warning("处理超时，返回默认动作")
             default = self.action_mapping.get("常态", "actions/idle")
             return [default], "系统繁忙，请稍候..."
+        finally:
+            self.latencies[mode].append(time.perf_counter() - start)
+            self._record_llm_activity(model_state, time.perf_counter() - start)
+
+        # 动作解析失败时退回的默认动作不应被缓存
+        if parsed:
+            self._cache_put(user_input, result)
+        return result
+
+    def _cache_get(self, user_input: str) -> Optional[Tuple[List[str], str]]:
+        if self.response_cache is None:
+            return None
+        try:
+            return self.response_cache.get(user_input)
+        except Exception as e:
+            self.logger.warning(f"读取响应缓存失败: {e}")
+            return None
+
+    def _cache_put(self, user_input: str, result: Tuple[List[str], str]):
+        actions, text = result
+        if self.response_cache is None or not actions or not text:
+            return
+        try:
+            self.response_cache.put(user_input, actions, text)
+        except Exception as e:
+            self.logger.warning(f"写入响应缓存失败: {e}")
+
+    async def _process_two_agent(self, user_input: str) -> Tuple[Tuple[List[str], str], bool]:
+        #generate text
+        await asyncio.wait_for(
+            asyncio.to_thread(
+                self.user_proxy.initiate_chat,
+                self.text_agent,
+                message=user_input,
+                clear_history=True
+            ),
+            timeout=60
+        )
+        raw_text = self.user_proxy.chat_messages[self.text_agent][-1]["content"]
+        text_response = self._validate_text_response(raw_text)
+
+        actions, parsed = await self._resolve_actions(user_input, text_response)
+
+        final_text = re.sub(r"</?STYLE>.*", "", text_response, flags=re.DOTALL).strip()
+        return (actions, final_text), parsed
+
+    async def _resolve_actions(self, user_input: str, text_response: str) -> Tuple[List[str], bool]:
+        if self.intent_matcher is not None:
+            situation = text_response.split("</STYLE>")[1] if "</STYLE>" in text_response else ""
+            names = self.intent_matcher.match(user_input, situation)
+            if names:
+                self.logger.info(f"本地解析动作: {names}")
+                return [self._get_action_path(name) for name in names], True
+        return await self._generate_actions(text_response)
+
+    async def _generate_actions(self, text_response: str) -> Tuple[List[str], bool]:
+        await asyncio.wait_for(
+            asyncio.to_thread(
+                self.user_proxy.initiate_chat,
+                self.action_agent,
+                message=text_response,
+                clear_history=True
+            ),
+            timeout=10
+        )
+        raw_action = self.user_proxy.chat_messages[self.action_agent][-1]["content"]
+        return self._parse_actions(raw_action)
+
+    async def _process_single_call(self, user_input: str) -> Tuple[Tuple[List[str], str], bool]:
+        await asyncio.wait_for(
+            asyncio.to_thread(
+                self.user_proxy.initiate_chat,
+                self.combined_agent,
+                message=user_input,
+                clear_history=True
+            ),
+            timeout=60
+        )
+        raw = self.user_proxy.chat_messages[self.combined_agent][-1]["content"]
+        return self._split_combined_response(raw)
+
+    def _split_combined_response(self, raw: str) -> Tuple[Tuple[List[str], str], bool]:
+        action_part, sep, text_part = raw.partition("</ACTION>")
+        if not sep:
+            # 模型漏写 </ACTION> 时，退化为在整段输出中查找动作
+            self.logger.warning(f"单次调用输出缺少 </ACTION>: {raw}")
+            action_part = raw
+            text_part = re.sub(r"动作[：:]\s*(\[[^\]]*\]\s*)+", "", raw)
+        actions, parsed = self._parse_actions(action_part)
+        text_response = self._validate_text_response(text_part)
+        final_text = re.sub(r"</?STYLE>.*", "", text_response, flags=re.DOTALL).strip()
+        return (actions, final_text), parsed
+
+    async def stream_input(self, user_input: str) -> AsyncIterator[Tuple[str, object]]:
+        """流式处理用户输入，依次产出事件：
+
+        ("text", 当前已生成的回复文本)  每收到新 token 产出一次
+        ("actions", 动作路径列表)        动作一经解析立即产出，只产出一次
+        ("done", (动作列表, 最终文本))   结束事件，总是最后产出
+
+        单次调用模式下动作写在输出开头，动作会先于文本到达；
+        双 Agent 模式下先流式输出文本，文本完成后再生成动作。
+        """
+        cached = self._cache_get(user_input)
+        if cached is not None:
+            actions, text = cached
+            yield "actions", actions
+            yield "text", text
+            yield "done", cached
+            return
+
+        model_state = self._model_state()
+        start = time.perf_counter()
+        first_text_at = None
+        actions = None
+        raw = ""
+        last_text = ""
+        try:
+            agent = self.combined_agent if self.single_call else self.text_agent
+            async for delta in self._stream_completion(agent.system_message, user_input, 0.3, timeout=60):
+                raw += delta
+                body = raw
+                if self.single_call:
+                    action_part, sep, body = raw.partition("</ACTION>")
+                    if not sep:
+                        continue
+                    if actions is None:
+                        actions, _ = self._parse_actions(action_part)
+                        yield "actions", actions
+                text = self._visible_text(body)
+                if text and text != last_text:
+                    last_text = text
+                    if first_text_at is None:
+                        first_text_at = time.perf_counter()
+                        self.latencies["stream_first_text"].append(first_text_at - start)
+                    yield "text", text
+
+            if self.single_call:
+                (final_actions, final_text), parsed = self._split_combined_response(raw)
+            else:
+                text_response = self._validate_text_response(raw)
+                final_text = re.sub(r"</?STYLE>.*", "", text_response, flags=re.DOTALL).strip()
+                final_actions, parsed = await self._resolve_actions(user_input, text_response)
+            if actions is None:
+                actions = final_actions
+                yield "actions", actions
+            if parsed:
+                self._cache_put(user_input, (actions, final_text))
+            yield "done", (actions, final_text)
+
+        except asyncio.TimeoutError:
+            self.logger.warning("流式处理超时，返回默认动作")
+            default = [self.action_mapping.get("常态", "actions/idle")]
+            if actions is None:
+                actions = default
+                yield "actions", actions
+            yield "done", (actions, "系统繁忙，请稍候...")
+        finally:
+            self.latencies["stream"].append(time.perf_counter() - start)
+            self._record_llm_activity(model_state, time.perf_counter() - start)
+
+    @staticmethod
+    def _visible_text(body: str) -> str:
+        # 截掉 </STYLE> 之后的情景理解，以及末尾尚未收全的标签片段
+        text = body.split("</STYLE>", 1)[0]
+        tag_start = text.rfind("<")
+        if tag_start != -1 and ">" not in text[tag_start:]:
+            text = text[:tag_start]
+        return text.strip()
+
+    async def _stream_completion(self, system_message: str, user_input: str,
+                                 temperature: float, timeout: float) -> AsyncIterator[str]:
+        """在线程中迭代 OpenAI 兼容接口的流式响应，把 token 增量转交给事件循环。"""
+        if self._stream_client is None:
+            config = self.llm_config["config_list"][0]
+            self._stream_client = openai.OpenAI(
+                base_url=config["base_url"],
+                api_key=config["api_key"],
+                timeout=self.llm_config["timeout"],
+                http_client=self.http_client,
+            )
+        model = self.llm_config["config_list"][0]["model"]
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        cancelled = False
+
+        def worker():
+            try:
+                stream = self._stream_client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_message},
+                        {"role": "user", "content": user_input},
+                    ],
+                    temperature=temperature,
+                    stream=True,
+                )
+                with stream:
+                    for chunk in stream:
+                        if cancelled:
+                            break
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            loop.call_soon_threadsafe(chunks.put_nowait, delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        loop.run_in_executor(None, worker)
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                item = await asyncio.wait_for(chunks.get(), timeout=max(0.0, deadline - loop.time()))
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled = True
+
+    @property
+    def _ollama_root(self) -> str:
+        base_url = self.llm_config["config_list"][0]["base_url"].rstrip("/")
+        return base_url[:-3] if base_url.endswith("/v1") else base_url
+
+    @staticmethod
+    def _duration_seconds(value: str) -> float:
+        units = {"s": 1, "m": 60, "h": 3600}
+        value = str(value).strip()
+        if value and value[-1] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+
+    def _model_state(self) -> str:
+        """根据最近一次预热或 /v1 请求粗略判断模型是否仍驻留在 Ollama 中。"""
+        if self._model_expiry is None:
+            return "cold"
+        return "warm" if time.monotonic() < self._model_expiry else "cold"
+
+    def _record_llm_activity(self, model_state: str, seconds: float):
+        self.latencies[model_state].append(seconds)
+        # 即使之前预热时设置了更长的 keep_alive，/v1 请求也会把过期时间重置为 5 分钟
+        self._model_expiry = time.monotonic() + OLLAMA_DEFAULT_KEEP_ALIVE
+
+    def _ollama_post(self, path: str, payload: dict, timeout: float) -> dict:
+        response = self.http_client.post(self._ollama_root + path, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def warm_up(self) -> Optional[float]:
+        """让 Ollama 加载模型并按 keep_alive 常驻，返回耗时（秒），失败时返回 None。"""
+        model = self.llm_config["config_list"][0]["model"]
+        start = time.perf_counter()
+        try:
+            # 空 prompt 只加载模型，不做生成
+            result = self._ollama_post("/api/generate", {"model": model, "keep_alive": self.keep_alive}, timeout=120)
+        except Exception as e:
+            self.logger.warning(f"Ollama 预热失败: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        self.latencies["warm_up"].append(elapsed)
+        keep_alive = self._duration_seconds(self.keep_alive)
+        # keep_alive 为负数时 Ollama 让模型一直常驻
+        self._model_expiry = time.monotonic() + keep_alive if keep_alive >= 0 else float("inf")
+        load_ms = result.get("load_duration", 0) / 1e6
+        self.logger.info(f"Ollama 预热完成，耗时 {elapsed:.2f} 秒（模型加载 {load_ms:.0f} ms）")
+        return elapsed
+
+    def start_keep_alive(self):
+        """后台定期保活；模型在下一次检查之前不会过期时跳过本次保活。"""
+        if self.keep_alive_interval is None or self._keep_alive_thread is not None:
+            return
+
+        def run():
+            while not self._keep_alive_stop.wait(self.keep_alive_interval):
+                expiry = self._model_expiry
+                if expiry is None or expiry - time.monotonic() <= self.keep_alive_interval:
+                    self.warm_up()
+
+        self._keep_alive_thread = threading.Thread(target=run, name="OllamaKeepAlive", daemon=True)
+        self._keep_alive_thread.start()
+
+    def stop_keep_alive(self):
+        self._keep_alive_stop.set()
+
+    def connection_stats(self) -> Dict[str, float]:
+        """连接池统计：请求数、新建 TCP 连接数和复用率。"""
+        return self.http_client.stats()
+
+    def close(self):
+        self.stop_keep_alive()
+        self.http_client.close()
+
+    def latency_report(self) -> Dict[str, Dict[str, float]]:
+        """按模式统计端到端延迟（秒），用于比较单次调用与双 Agent 流程。"""
+        report = {}
+        for mode, samples in self.latencies.items():
+            if samples:
+                report[mode] = {
+                    "count": len(samples),
+                    "mean": statistics.fmean(samples),
+                    "median": statistics.median(samples),
+                    "max": max(samples),
+                }
+        return report
 
     def _validate_text_response(self, text: str) -> str:
         return text
 
-    def _parse_actions(self, response: str) -> List[str]:
-
+    def _parse_actions(self, response: str) -> Tuple[List[str], bool]:
+        """返回 (动作路径列表, 是否解析成功)；格式解析失败时返回默认动作和 False。"""
         raw_actions = re.findall(r"\[([^\]]+?)\]", response)
         if not raw_actions:
             self.logger.error(f"动作格式解析失败: {response}")
             default = self.action_mapping.get("常态", "actions/idle")
-            return [default]
+            return [default], False
 
         found = []
         for name in raw_actions:
@@ -252,7 +619,7 @@ action_map = {{
             else:
                 self.logger.warning(f"忽略无效动作: {name}")
 
-        return found[:3]
+        return found[:3], True
 
 
 async def main():
@@ -264,9 +631,14 @@ async def main():
         "向后走": "actions/back",
         "常态": "actions/normal",
     }
-    system = DigitalHumanAgentSystem(action_map)
-    acts, txt = await system.process_input("皮影起源是什么？")
-    print(f"回复：{txt} | 动作：{acts}")
+    for single_call in (False, True):
+        system = DigitalHumanAgentSystem(action_map, single_call=single_call)
+        system.warm_up()
+        acts, txt = await system.process_input("皮影起源是什么？")
+        print(f"回复：{txt} | 动作：{acts}")
+        print(f"延迟统计：{system.latency_report()}")
+        print(f"连接复用：{system.connection_stats()}")
+        system.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
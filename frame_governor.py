@@ -0,0 +1,81 @@
+import collections
+
+import numpy as np
+
+# 质量等级，按降级顺序排列：先放宽旋转缓存的角度步长，再降低目标帧率
+QUALITY_LEVELS = [
+    {"angle_step": 0.5, "fps": 45},
+    {"angle_step": 2.0, "fps": 45},
+    {"angle_step": 4.0, "fps": 45},
+    {"angle_step": 4.0, "fps": 30},
+    {"angle_step": 4.0, "fps": 20},
+]
+
+
+class FrameGovernor:
+    """根据最近若干帧的耗时自动调整渲染质量。
+
+    record() 记录每帧的实际工作耗时（不含 clock.tick 的等待）。窗口内 p90 超出当前等级的帧预算时降一级；
+    低于上一级预算的 restore_ratio 倍时恢复一级。每次调整后清空窗口，至少间隔 min_frames 帧再做判断。
+    """
+
+    def __init__(self, levels=QUALITY_LEVELS, max_fps=None, window=90, min_frames=45,
+                 restore_ratio=0.6, on_change=None):
+        self.levels = [dict(level) for level in levels]
+        if max_fps is not None:
+            for level in self.levels:
+                level["fps"] = min(level["fps"], max_fps)
+        self.min_frames = min_frames
+        self.restore_ratio = restore_ratio
+        self.on_change = on_change
+        self.level = 0
+        self.changes = 0
+        self._samples = collections.deque(maxlen=window)
+
+    @property
+    def fps(self):
+        return self.levels[self.level]["fps"]
+
+    @property
+    def angle_step(self):
+        return self.levels[self.level]["angle_step"]
+
+    def _budget(self, level):
+        return 1.0 / self.levels[level]["fps"]
+
+    def record(self, frame_seconds):
+        """记录一帧耗时（秒），质量等级变化时返回 True。"""
+        self._samples.append(frame_seconds)
+        if len(self._samples) < self.min_frames:
+            return False
+        p90 = float(np.percentile(self._samples, 90))
+        if p90 > self._budget(self.level) and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1)
+            return True
+        if self.level > 0 and p90 < self._budget(self.level - 1) * self.restore_ratio:
+            self._set_level(self.level - 1)
+            return True
+        return False
+
+    def _set_level(self, level):
+        self.level = level
+        self.changes += 1
+        self._samples.clear()
+        if self.on_change:
+            self.on_change(self.levels[level])
+
+    def percentiles(self):
+        """窗口内帧耗时的 p50/p90/p99（毫秒）。"""
+        if not self._samples:
+            return {}
+        p50, p90, p99 = np.percentile(self._samples, [50, 90, 99]) * 1000
+        return {"p50": float(p50), "p90": float(p90), "p99": float(p99)}
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "fps": self.fps,
+            "angle_step": self.angle_step,
+            "changes": self.changes,
+            "frame_ms": self.percentiles(),
+        }
@@ -0,0 +1,170 @@
+"""
+无窗口批量渲染动作序列：使用 SDL dummy 驱动在普通 Surface 上绘制，不做 clock.tick 限速，
+逐帧输出图片（PNG/BMP/TGA），或把原始 RGB 数据通过管道交给 ffmpeg 编码。多个序列在进程池中并行渲染。
+单帧绘制不到 1 ms，PNG 压缩是逐帧输出时的主要耗时；需要速度时用 bmp/tga 或 ffmpeg。
+
+    python headless_render.py greet dance+dun --format ffmpeg --fps 30 --workers 4
+
+每个参数是一个序列，用 "+" 连接多个动作；不带参数时渲染 pygame_Alpha.JsonList，命名为 VIDEO_NAME。
+"""
+import argparse
+import math
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# 必须在导入 pygame 之前设置
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import pygame_Alpha as pg_base
+from motion_clip import CLIP_SUFFIXES, MotionClip, find_clip
+
+FFMPEG = "ffmpeg"
+IMAGE_FORMATS = ("png", "bmp", "tga")
+
+# 每个进程只初始化一次 pygame 和素材；背景按分辨率缓存
+_mats = None
+_backgrounds = {}
+
+
+def _assets(size):
+    global _mats
+    if _mats is None:
+        pygame.display.init()
+        # convert()/convert_alpha() 需要一个显示模式，dummy 驱动下不会创建真实窗口
+        pygame.display.set_mode((1, 1))
+        _mats = pg_base.load_materials()
+        for part, img in _mats.items():
+            w_img, h_img = img.get_size()
+            pg_base.PART_PARAM[part][0] = w_img // 2
+            pg_base.PART_PARAM[part][1] = 0
+    if size not in _backgrounds:
+        _backgrounds[size] = pygame.transform.smoothscale(pygame.image.load(pg_base.BACKGROUND_IMG).convert(), size)
+    return _backgrounds[size], _mats
+
+
+def load_sequence(actions, action_dir="actions", elbow_dy=pg_base.ELBOW_DY, blend_frames=pg_base.BLEND_FRAMES):
+    """按 pygame_Alpha.main 的方式加载并拼接动作，actions 为文件名（如 "greet"）或动作文件路径。"""
+    clips = []
+    for action in actions:
+        path = Path(action) if Path(action).suffix in CLIP_SUFFIXES else find_clip(action_dir, action)
+        if path is None:
+            raise FileNotFoundError(Path(action_dir) / f"{action}.json")
+        clips.append(MotionClip.load(path).apply_fixups(elbow_dy=elbow_dy))
+    w, h = clips[-1].resolution
+    sequence = MotionClip.stitch(clips, blend_frames=blend_frames)
+    sequence.center_pelvis(w // 2, h // 2)
+    return sequence
+
+
+def _open_ffmpeg(path, size, fps):
+    return subprocess.Popen(
+        [FFMPEG, "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", f"{fps:g}", "-i", "-",
+         "-c:v", "libx264", "-pix_fmt", "yuv420p", str(path)],
+        stdin=subprocess.PIPE,
+    )
+
+
+def render_job(actions, name, output_dir=pg_base.OUTPUT_DIR, fmt="png", fps=None, **load_options):
+    """渲染一个动作序列。fps 为 None 时每个数据帧输出一帧，否则按时间重采样到 fps。
+
+    fmt 为图片格式时写入 output_dir/name/frame_00000.<fmt> ...；fmt="ffmpeg" 写入 output_dir/name.mp4。
+    返回包含帧数、耗时和渲染帧率的统计。
+    """
+    start = time.perf_counter()
+    sequence = load_sequence(actions, **load_options)
+    size = tuple(int(v) for v in sequence.resolution)
+    bg, mats = _assets(size)
+    surface = pygame.Surface(size)
+    adjusted_initial_joints = sequence.frame(0).copy()
+
+    out_fps = fps or sequence.fps
+    count = len(sequence) if fps is None else math.ceil(sequence.duration * fps)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if fmt in IMAGE_FORMATS:
+        target = output_dir / name
+        target.mkdir(exist_ok=True)
+        encoder = None
+    elif fmt == "ffmpeg":
+        target = output_dir / f"{name}.mp4"
+        encoder = _open_ffmpeg(target, size, out_fps)
+    else:
+        raise ValueError(f"未知的输出格式: {fmt}")
+
+    try:
+        for i in range(count):
+            joints = sequence.frame(i) if fps is None else sequence.sample(i / fps)
+            idx = i if fps is None else min(int(i / fps * sequence.fps), len(sequence) - 1)
+            pg_base.render(surface, bg, mats, joints, adjusted_initial_joints, idx)
+            if encoder is None:
+                pygame.image.save(surface, str(target / f"frame_{i:05d}.{fmt}"))
+            else:
+                encoder.stdin.write(pygame.image.tobytes(surface, "RGB"))
+    finally:
+        if encoder is not None:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg 编码失败 (返回码 {encoder.returncode}): {target}")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "name": name,
+        "output": str(target),
+        "frames": count,
+        "seconds": elapsed,
+        "render_fps": count / elapsed if elapsed else 0.0,
+        "sprite_cache": pg_base.sprite_cache.stats(),
+    }
+
+
+def render_batch(jobs, workers=None, **options):
+    """在进程池中并行渲染多个序列。jobs 为 {名称: [动作, ...]}，按完成顺序返回统计列表。"""
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_job, actions, name, **options): name for name, actions in jobs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[错误] 序列 '{name}' 渲染失败: {e}")
+                continue
+            results.append(result)
+            print(f"[{len(results)}/{len(jobs)}] {name}: {result['frames']} 帧, "
+                  f"{result['seconds']:.1f} 秒, {result['render_fps']:.1f} fps -> {result['output']}")
+    total_frames = sum(r["frames"] for r in results)
+    elapsed = time.perf_counter() - start
+    print(f"共渲染 {total_frames} 帧，耗时 {elapsed:.1f} 秒，总吞吐 {total_frames / elapsed:.1f} fps")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无窗口批量渲染皮影动作序列")
+    parser.add_argument("sequences", nargs="*", help='动作序列，如 "greet" 或 "dance+dun"')
+    parser.add_argument("--format", choices=IMAGE_FORMATS + ("ffmpeg",), default="png")
+    parser.add_argument("--fps", type=float, default=None, help="输出帧率，默认按动作数据的采样帧率逐帧输出")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数，默认为 CPU 核数")
+    parser.add_argument("--output-dir", default=pg_base.OUTPUT_DIR)
+    parser.add_argument("--action-dir", default="actions")
+    args = parser.parse_args()
+
+    if args.sequences:
+        jobs = {"+".join(Path(a).stem for a in seq.split("+")): seq.split("+") for seq in args.sequences}
+    else:
+        jobs = {pg_base.VIDEO_NAME: list(pg_base.JsonList)}
+    render_batch(
+        jobs, workers=args.workers, output_dir=args.output_dir, fmt=args.format,
+        fps=args.fps, action_dir=args.action_dir,
+    )
+
+
+if __name__ == "__main__":
+    main()
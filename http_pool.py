@@ -0,0 +1,48 @@
+import threading
+
+import httpx
+
+
+class PooledHttpClient(httpx.Client):
+    """所有 LLM 请求共用的 keep-alive 连接池，并统计连接复用情况。
+
+    autogen 会深拷贝 llm_config，__deepcopy__ 返回自身，保证各 Agent 共享同一个连接池。
+    """
+
+    def __init__(self, max_connections=8, max_keepalive_connections=4, keepalive_expiry=300.0, **kwargs):
+        super().__init__(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            event_hooks={"request": [self._attach_trace]},
+            **kwargs,
+        )
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _attach_trace(self, request):
+        with self._stats_lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, info):
+        # 只有新建 TCP 连接时才会出现 connect_tcp 事件，复用连接时不会
+        if event_name == "connection.connect_tcp.complete":
+            with self._stats_lock:
+                self.new_connections += 1
+
+    def stats(self):
+        with self._stats_lock:
+            requests, new_connections = self.requests, self.new_connections
+        return {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused": requests - new_connections,
+            "reuse_rate": (requests - new_connections) / requests if requests else 0.0,
+        }
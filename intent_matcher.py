@@ -0,0 +1,149 @@
+from typing import Dict, Iterable, List, Optional
+
+# 动作别名，取自 Agent 系统提示词中的示例；值为 action_mapping 中的动作名。
+# 只收动词短语，用户原话中的名词（"皮影的前进方向"）不代表动作请求
+ACTION_SYNONYMS = {
+    "拱手": ["拱手礼"],
+    "行个礼": ["行礼"],
+    "跳个舞": ["跳舞"],
+    "跳支舞": ["跳舞"],
+    "跳一段舞": ["跳舞"],
+    "往前走": ["向前走"],
+    "往后走": ["向后走"],
+    "演示皮影技艺": ["向前走", "行礼", "跳舞"],
+    "展示皮影技艺": ["向前走", "行礼", "跳舞"],
+}
+
+# 只在情景理解的 "动作指令" 字段中使用的简称，该字段已由 LLM 判定为动作请求
+COMMAND_SYNONYMS = {
+    "舞蹈": ["跳舞"],
+    "前进": ["向前走"],
+    "后退": ["向后走"],
+}
+
+# 情景理解 -> 动作，取自动作 Agent 系统提示词中的应用案例
+SITUATION_ACTIONS = {
+    "询问我的名字": ["拱手礼"],
+    "询问我会哪些技能": ["拱手礼"],
+    "历史渊源": ["常态"],
+    "制作工艺": ["常态"],
+    "演出时间": ["常态"],
+    "工艺细节的难点": ["常态"],
+    "话题延伸推荐": ["常态"],
+    "展示舞蹈技能": ["跳舞"],
+    "展示皮影技艺": ["向前走", "行礼", "跳舞"],
+}
+
+# 出现否定词时不做本地判断，交给动作 Agent；响应缓存也不缓存这类输入
+NEGATIONS = ("不要", "不用", "不想", "不必", "不许", "不准", "没有", "别")
+# 含否定字但并非否定的常见词，判断前先去掉
+NEGATION_EXCEPTIONS = ("有没有", "特别", "区别", "差别", "分别", "类别", "级别", "性别", "个别", "告别", "离别",
+                       "识别", "辨别", "别人", "别的", "别处")
+
+
+def has_negation(text: str) -> bool:
+    """文本中是否含有否定词，如 "不要跳舞"、"别走了"。"""
+    for word in NEGATION_EXCEPTIONS:
+        text = text.replace(word, "")
+    return any(neg in text for neg in NEGATIONS)
+
+# 直接扫描用户原话时只接受祈使句：疑问句（"跳舞有什么讲究？"）即使含动作关键词也交给 LLM；
+# 祈使句中也只认动作名和动词短语（"请介绍一下皮影的前进方向" 不会触发向前走）
+QUESTION_MARKERS = ("?", "？", "吗", "呢", "什么", "怎么", "怎样", "如何", "为什么", "为何", "哪", "几", "多少", "是否")
+COMMAND_PREFIXES = ("请", "麻烦", "给我", "为我", "帮我", "再", "我想看", "我要看")
+SHORT_COMMAND_LENGTH = 6  # 不超过该长度的非疑问句（如 "跳个舞"、"往前走两步"）也视为指令
+
+
+class _Trie:
+    def __init__(self, phrases: Dict[str, List[str]]):
+        self.root = {}
+        for phrase, actions in phrases.items():
+            node = self.root
+            for ch in phrase:
+                node = node.setdefault(ch, {})
+            node[None] = actions
+
+    def scan(self, text: str) -> List[str]:
+        """从左到右做最长匹配，按出现顺序返回命中的动作。"""
+        found = []
+        i = 0
+        while i < len(text):
+            node, j, match, match_end = self.root, i, None, i
+            while j < len(text) and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if None in node:
+                    match, match_end = node[None], j
+            if match is None:
+                i += 1
+            else:
+                found.extend(match)
+                i = match_end
+        return found
+
+
+class IntentMatcher:
+    """基于关键词前缀树的本地动作解析，命中时可跳过动作 Agent。
+
+    match() 返回动作名列表；无法高置信度判断时返回 None，由调用方回退到 LLM。
+    """
+
+    def __init__(self, action_names: Iterable[str], max_actions: int = 3):
+        names = set(action_names)
+        self.max_actions = max_actions
+        keywords = {name: [name] for name in names}
+        keywords.update({
+            phrase: actions for phrase, actions in ACTION_SYNONYMS.items()
+            if all(a in names for a in actions)
+        })
+        self._keywords = _Trie(keywords)
+        keywords.update({
+            phrase: actions for phrase, actions in COMMAND_SYNONYMS.items()
+            if all(a in names for a in actions)
+        })
+        self._commands = _Trie(keywords)
+        self._situations = _Trie({
+            phrase: actions for phrase, actions in SITUATION_ACTIONS.items()
+            if all(a in names for a in actions)
+        })
+        self.fast_path_hits = 0
+        self.fallbacks = 0
+
+    def match(self, user_input: str, situation: str = "") -> Optional[List[str]]:
+        actions = self._match(user_input, situation)
+        if actions:
+            self.fast_path_hits += 1
+            return actions[:self.max_actions]
+        self.fallbacks += 1
+        return None
+
+    def _match(self, user_input: str, situation: str) -> Optional[List[str]]:
+        if has_negation(user_input):
+            return None
+        # 情景理解中明确给出的动作指令，例如 "用户正在请求具体的动作指令：向前走，行礼"
+        _, sep, commands = situation.partition("动作指令")
+        if sep:
+            actions = self._commands.scan(commands)
+            if actions:
+                return actions
+        actions = self._situations.scan(situation)
+        if actions:
+            return actions
+        if not self._is_command(user_input):
+            return None
+        return self._keywords.scan(user_input) or None
+
+    @staticmethod
+    def _is_command(user_input: str) -> bool:
+        text = user_input.strip()
+        if any(marker in text for marker in QUESTION_MARKERS):
+            return False
+        return text.startswith(COMMAND_PREFIXES) or len(text.rstrip("。！!吧啊呀")) <= SHORT_COMMAND_LENGTH
+
+    def stats(self) -> dict:
+        total = self.fast_path_hits + self.fallbacks
+        return {
+            "fast_path_hits": self.fast_path_hits,
+            "fallbacks": self.fallbacks,
+            "fast_path_rate": self.fast_path_hits / total if total else 0.0,
+        }
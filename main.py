@@ -10,11 +10,12 @@
 import threading
 import asyncio
 import queue
-import json
 import os
 from pathlib import Path
+from functools import lru_cache
 import time
 
+PROCESS_START = time.perf_counter()
 
 import pygame
 import pygame.freetype
@@ -22,14 +23,18 @@ import pygame.freetype
 
 import sounddevice as sd
 import numpy as np
-from vosk import Model, KaldiRecognizer
 
 try:
-    from digital_human_agents_v2 import DigitalHumanAgentSystem
+    from motion_clip import MotionClip, crossfade, find_clip, smoothstep
+    from action_library import ActionLibrary
+    from response_cache import ResponseCache
+    from agent_worker import AgentWorker
+    from speech_stream import StreamingRecognizer, EnergyEndpointer, HandsFreeListener
+    from frame_governor import FrameGovernor
     import pygame_Alpha as pg_base
 except ImportError as e:
     print(f"[致命错误] 无法导入必要的自定义模块: {e}")
-    print("请确保 'digital_human_agents_v2.py' 和 'pygame_Alpha_base.py' 文件存在于同一目录。")
+    print("请确保 'pygame_Alpha.py' 等自定义模块文件存在于同一目录。")
     exit()
 
 ACTION_MAP = {
@@ -41,11 +46,25 @@ ACTION_MAP = {
     "向后走":   "back",
     "空闲":   "idle",
 }
-FPS = 45
+FPS = 45          # 渲染帧率上限；动作按片段自身的 fps 以实际时间播放，与渲染帧率无关
+FRAME_GOVERNOR = True  # 帧耗时超出预算时逐级降低旋转精度和帧率，余量恢复后还原
+SHOW_FRAME_STATS = False  # 在左下角显示质量等级和帧耗时分位数
+MAX_FRAME_TIME = 0.25  # 秒；卡顿后单帧最多推进的动画时间，避免一次跳过大段动作
+BLEND_FRAMES = 8  # 动作切换及拼接处的姿态过渡时长（按片段 fps 计的帧数），0 为直接切换
+AGENT_SINGLE_CALL = False  # True: 一次 LLM 调用同时生成回复与动作
+AGENT_STREAMING = True     # True: 流式显示回复文本，动作解析后立即开始播放
+AGENT_MAX_CONCURRENCY = 1  # 同时进行的 LLM 请求数，新输入会取代未完成的旧输入
+OLLAMA_KEEP_ALIVE = "30m"           # 预热/保活请求中的 keep_alive
+OLLAMA_KEEP_ALIVE_INTERVAL = 240    # 秒；需小于 Ollama 默认的 5 分钟过期时间，None 为关闭保活
+RESPONSE_CACHE_PATH = "response_cache.db"
+RESPONSE_CACHE_TTL = 7 * 24 * 3600   # 秒
+RESPONSE_CACHE_FUZZY = 0.9           # 字符 bigram 相似度阈值，None 为仅精确匹配
 
 REC_FS = 16000
 REC_CHANNELS = 1
 REC_BLOCKSIZE = 4000
+VAD_THRESHOLD_DB = 10.0   # 免提模式：高于噪声基底多少 dB 视为语音
+VAD_HANGOVER_BLOCKS = 3   # 免提模式：连续多少个静音块（每块 0.25 秒）判定一句话结束
 VOSK_MODEL_PATH = "model-cn/vosk-model-cn-0.22"
 
 
@@ -76,35 +95,57 @@ RECOGNIZED_TEXT_DURATION = FPS * 4
 OUTPUT_FADE_DURATION = FPS // 3
 
 action_queue = queue.Queue()
+
+# 启动阶段：窗口先出现，Agent 系统和 Vosk 模型在后台线程中并行加载
+agent_ready = threading.Event()
+vosk_ready = threading.Event()
+startup_timings = {}
+startup_lock = threading.Lock()
+startup_reported = False
+action_library = ActionLibrary(ACTION_MAP, priority=("空闲", "常态"))
 dh_system = None
 
 is_recording = False
-audio_buffers = []
+speech_recognizer = None
 rec_stream = None
+is_listening = False
+hands_free_listener = None
 vosk_model = None
 last_recognized_text = ""
 recognized_text_timer = 0
+# 流式回复：Agent 线程写入文本并递增版本号，渲染线程据版本号刷新显示
+streaming_reply = ""
+streaming_version = 0
 
 def initialize_agent_system():
-    """初始化 DigitalHumanAgentSystem。"""
+    """初始化 DigitalHumanAgentSystem。autogen 在此处才导入，以免拖慢窗口出现。"""
     global dh_system
     try:
-        action_paths = {
-            k: f"actions/{v}.json" for k, v in ACTION_MAP.items() if v
-        }
+        from digital_human_agents_v2 import DigitalHumanAgentSystem
         valid_paths = {}
-        for name, path in action_paths.items():
-            if Path(path).exists():
-                valid_paths[name] = path
+        for name, stem in ACTION_MAP.items():
+            if not stem:
+                continue
+            path = find_clip(action_library.action_dir, stem)
+            if path is not None:
+                valid_paths[name] = str(path)
             else:
-                print(f"[警告] 动作文件未找到，将忽略: {path}")
+                print(f"[警告] 动作文件未找到，将忽略: actions/{stem}.json")
 
         if not valid_paths:
              print("[错误] 未找到任何有效的动作文件。请检查 'actions' 目录和 ACTION_MAP")
              dh_system = None
         else:
              print(f"初始化 Agent 系统，使用动作: {list(valid_paths.keys())}")
-             dh_system = DigitalHumanAgentSystem(valid_paths)
+             cache = ResponseCache(RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, fuzzy_threshold=RESPONSE_CACHE_FUZZY)
+             dh_system = DigitalHumanAgentSystem(
+                 valid_paths, single_call=AGENT_SINGLE_CALL, response_cache=cache,
+                 keep_alive=OLLAMA_KEEP_ALIVE, keep_alive_interval=OLLAMA_KEEP_ALIVE_INTERVAL,
+             )
+             warm_up_seconds = dh_system.warm_up()
+             if warm_up_seconds is not None:
+                 record_startup_phase("ollama_warm_up", warm_up_seconds)
+             dh_system.start_keep_alive()
 
     except Exception as e:
         print(f"[错误] 初始化 DigitalHumanAgentSystem 失败: {e}")
@@ -120,6 +161,7 @@ def initialize_vosk_model():
         return
 
     try:
+        from vosk import Model
         print(f"加载 Vosk 模型: {VOSK_MODEL_PATH} ...")
         vosk_model = Model(str(model_path))
         print("Vosk 模型加载成功。")
@@ -127,6 +169,31 @@ def initialize_vosk_model():
         print(f"[错误] 加载 Vosk 模型失败: {e}")
         vosk_model = None
 
+def run_startup_task(name, func, ready_event):
+    """在后台线程中执行初始化任务，记录耗时并设置就绪事件。"""
+    def run():
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            record_startup_phase(name, time.perf_counter() - start)
+            ready_event.set()
+    threading.Thread(target=run, name=f"init-{name}", daemon=True).start()
+
+def record_startup_phase(name, seconds):
+    global startup_reported
+    with startup_lock:
+        startup_timings[name] = seconds
+        if startup_reported or not (agent_ready.is_set() and vosk_ready.is_set() and "first_frame" in startup_timings):
+            return
+        startup_reported = True
+    if "__total__" in action_library.load_times:
+        startup_timings.setdefault("action_library", action_library.load_times["__total__"])
+    print("[启动] 各阶段耗时:")
+    for phase, seconds in startup_timings.items():
+        print(f"    {phase:<16} {seconds * 1000:8.1f} ms")
+    print(f"    {'ready_total':<16} {(time.perf_counter() - PROCESS_START) * 1000:8.1f} ms")
+
 def initialize_fonts():
     global main_font, input_font, status_font
     try:
@@ -189,93 +256,171 @@ def create_output_box(width, height):
 
 
 
-def process_and_enqueue(text: str):
-
+def wrap_text(text, font, max_width):
+    """按字符折行，每行宽度小于 max_width。"""
+    wrapped_lines = []
+    current_line = ""
+    for char in text:
+        test_line = current_line + char
+        if font.get_rect(test_line).width < max_width:
+            current_line = test_line
+        else:
+            wrapped_lines.append(current_line)
+            current_line = char
+    if current_line:
+        wrapped_lines.append(current_line)
+    return wrapped_lines
+
+@lru_cache(maxsize=16)
+def render_output_box(text, font, max_text_width, max_box_width, max_box_height,
+                      padding_x=20, padding_y=15, line_spacing=6):
+    """把回复文字折行后与输出框一起预渲染到一张表面上，按 (文本, 字体, 宽度) 缓存。
+
+    每条回复只折行、渲染一次；显示期间逐帧只调整返回表面的 alpha。
+    """
+    wrapped_lines = wrap_text(text, font, max_text_width)
+    text_rects = [font.get_rect(line) for line in wrapped_lines]
+    total_text_height = sum(r.height for r in text_rects) + max(0, len(wrapped_lines) - 1) * line_spacing
+    max_line_width = max(r.width for r in text_rects) if text_rects else 0
+
+    box_width = min(max(max_line_width + 2 * padding_x, 150), max_box_width)
+    box_height = min(max(total_text_height + 2 * padding_y, 50), max_box_height)
+    box = create_output_box(box_width, box_height)
+    current_y = padding_y
+    for line, rect in zip(wrapped_lines, text_rects):
+        font.render_to(box, (padding_x, current_y), line, UI_COLORS["text"])
+        current_y += rect.height + line_spacing
+    return box
+
+def blit_with_alpha(surface, img, pos, alpha):
+    # 缓存的表面在多帧间共用，透明度在绘制时设置
+    img.set_alpha(alpha)
+    return surface.blit(img, pos)
+
+def draw_text(surface, font, pos, text, color):
+    """先渲染再 blit：freetype 的 render_to 不受 set_clip 限制，脏矩形重绘时会越界叠画。"""
+    text_surf, _ = font.render(text, color)
+    return surface.blit(text_surf, pos)
+
+def checked_actions(acts):
+    if not isinstance(acts, list):
+        print(f"[警告] Agent 返回的动作不是列表: {acts}, 使用 'idle' 代替。")
+        return ['idle']
+    return acts or ['idle']
+
+def set_streaming_reply(text: str):
+    global streaming_reply, streaming_version
+    streaming_reply = text
+    streaming_version += 1
+
+async def stream_and_enqueue(text: str):
+    """消费 Agent 的流式输出：文本逐步写入 streaming_reply，动作一经解析立即入队。"""
+    acts = reply = None
+    set_streaming_reply("")
+    try:
+        async for kind, value in dh_system.stream_input(text):
+            if kind == "text":
+                set_streaming_reply(value)
+            elif kind == "actions":
+                acts = checked_actions(value)
+                # 回复为 None 表示文本由 streaming_reply 持续提供
+                action_queue.put((acts, None))
+            elif kind == "done":
+                reply = value[1]
+                set_streaming_reply(reply)
+    except Exception as e:
+        if acts is None:
+            raise
+        print(f"[Agent] 流式输出中断: {e}")
+        reply = "抱歉，我处理时遇到点麻烦。"
+        set_streaming_reply(reply)
+    return acts, reply
+
+async def handle_agent_input(text: str):
+    """在 AgentWorker 的事件循环中处理一次输入，并把结果放入 action_queue。"""
     global last_recognized_text, recognized_text_timer
+    if not agent_ready.is_set():
+        print("[Agent] 对话系统仍在加载，输入将在加载完成后处理。")
+        await asyncio.to_thread(agent_ready.wait)
     if not dh_system:
         print("[警告] Agent 系统未初始化，无法处理输入。")
         action_queue.put((['idle'], "Agent系统似乎出了一些问题。"))
         return
 
-    text = text.strip()
-    if not text:
-        print("[Agent] 输入为空，忽略。")
-        return
-
     try:
 
-        acts, reply = asyncio.run(dh_system.process_input(text))
+        if AGENT_STREAMING:
+            acts, reply = await stream_and_enqueue(text)
+        else:
+            acts, reply = await dh_system.process_input(text)
+            acts = checked_actions(acts)
+            action_queue.put((acts, reply))
         print(f"[Agent] 输入: '{text}' -> 回复: '{reply}' | 动作: {acts}")
-
-        if not isinstance(acts, list):
-            print(f"[警告] Agent 返回的动作不是列表: {acts}, 使用 'idle' 代替。")
-            acts = ['idle']
-        if not acts:
-             acts = ['idle']
-
-        action_queue.put((acts, reply))
+        if dh_system.response_cache is not None:
+            print(f"[Agent] 响应缓存: {dh_system.response_cache.stats()}")
+        if dh_system.intent_matcher is not None:
+            print(f"[Agent] 本地动作解析: {dh_system.intent_matcher.stats()}")
 
         last_recognized_text = ""
         recognized_text_timer = 0
 
+    except asyncio.CancelledError:
+        print(f"[Agent] 输入 '{text}' 已被新的输入取代。")
+        raise
     except Exception as e:
         print(f"[Agent] 调用失败: {e}")
         action_queue.put((['idle'], "抱歉，我处理时遇到点麻烦。"))
 
+agent_worker = AgentWorker(handle_agent_input, max_concurrency=AGENT_MAX_CONCURRENCY, supersede=True)
+
+def process_and_enqueue(text: str):
+    """提交用户输入给 Agent 工作线程，立即返回。"""
+    text = text.strip()
+    if not text:
+        print("[Agent] 输入为空，忽略。")
+        return
+    agent_worker.submit(text)
+
 def audio_callback(indata: np.ndarray, frames: int, time_info, status):
 
     if status:
         print(f"[录音警告] {status}")
-    if is_recording:
-        audio_buffers.append(indata.copy())
-
-def recognize_and_enqueue(pcm_data: np.ndarray):
+    if is_recording and speech_recognizer:
+        speech_recognizer.feed(indata.copy())
 
+def on_partial_recognition(text: str):
+    """录音过程中实时显示部分识别结果。"""
     global last_recognized_text, recognized_text_timer
-    if not vosk_model:
-        print("[警告] Vosk 模型未加载，无法进行语音识别。")
-        last_recognized_text = "语音识别不可用"
-        recognized_text_timer = RECOGNIZED_TEXT_DURATION # 显示消息
-        return
-
-    try:
-        print(f"开始识别 {len(pcm_data) / REC_FS:.2f} 秒的音频...")
-        recognizer = KaldiRecognizer(vosk_model, REC_FS)
-        recognizer.AcceptWaveform(pcm_data.tobytes())
-        result_json = recognizer.FinalResult()
-        res = json.loads(result_json)
-        recognized_text = res.get("text", "").strip()
+    last_recognized_text = text
+    recognized_text_timer = RECOGNIZED_TEXT_DURATION
 
-        print(f"[Vosk 离线识别] 结果: '{recognized_text if recognized_text else '<无结果>'}'")
+def on_final_recognition(recognized_text: str):
 
-        last_recognized_text = recognized_text if recognized_text else "未识别到内容"
-        recognized_text_timer = RECOGNIZED_TEXT_DURATION
+    global last_recognized_text, recognized_text_timer
+    print(f"[Vosk 流式识别] 结果: '{recognized_text if recognized_text else '<无结果>'}'")
 
-        if recognized_text:
+    last_recognized_text = recognized_text if recognized_text else "未识别到内容"
+    recognized_text_timer = RECOGNIZED_TEXT_DURATION
 
-            process_and_enqueue(recognized_text)
-        # else:
-            # action_queue.put((['thinking'], ""))
-
-    except json.JSONDecodeError as e:
-        print(f"[识别错误] 无法解析 Vosk 返回的 JSON: {result_json} - {e}")
-        last_recognized_text = "识别结果解析错误"
-        recognized_text_timer = RECOGNIZED_TEXT_DURATION
-    except Exception as e:
-        print(f"[识别失败] 处理音频时发生错误: {e}")
-        last_recognized_text = "识别过程出错"
-        recognized_text_timer = RECOGNIZED_TEXT_DURATION
+    if recognized_text:
+        process_and_enqueue(recognized_text)
 
 def toggle_recording():
-    global is_recording, rec_stream, audio_buffers
+    global is_recording, rec_stream, speech_recognizer, last_recognized_text, recognized_text_timer
     if not vosk_model:
         print("[警告] Vosk 模型未加载，无法启动录音。")
+        last_recognized_text = "语音识别不可用" if vosk_ready.is_set() else "语音模型加载中，请稍候"
+        recognized_text_timer = RECOGNIZED_TEXT_DURATION
         return
 
     if not is_recording:
         print("[录音] 开始...")
-        audio_buffers = []
         try:
+            speech_recognizer = StreamingRecognizer(
+                vosk_model, REC_FS,
+                on_partial=on_partial_recognition,
+                on_final=on_final_recognition,
+            ).start()
             rec_stream = sd.InputStream(
                 samplerate=REC_FS,
                 channels=REC_CHANNELS,
@@ -285,7 +430,7 @@ def toggle_recording():
             )
             rec_stream.start()
             is_recording = True
-            print("[录音] 录音流已启动。按 'Space' 停止。")
+            print("[录音] 录音流已启动，边录边识别。按 'Space' 停止。")
         except sd.PortAudioError as e:
              print(f"[录音错误] PortAudio 错误: {e}")
              print("请检查音频设备是否连接/可用，或尝试重启程序。")
@@ -295,6 +440,9 @@ def toggle_recording():
             print(f"[录音错误] 无法启动录音流: {e}")
             is_recording = False
             rec_stream = None
+        if not is_recording and speech_recognizer:
+            speech_recognizer.finish()
+            speech_recognizer = None
     else:
         print("[录音] 停止...")
         is_recording = False
@@ -308,136 +456,90 @@ def toggle_recording():
             finally:
                  rec_stream = None
 
-        if not audio_buffers:
-            print("[录音] 未录制到有效音频数据。")
-            last_recognized_text = "未录到声音"
-            recognized_text_timer = RECOGNIZED_TEXT_DURATION // 2
-            return
-
-        try:
-            full_audio_data = np.concatenate(audio_buffers, axis=0)
-            audio_buffers = []
-
-            print(f"[录音] 音频数据合并完毕 ({len(full_audio_data)} 样本), 准备识别...")
-
-            threading.Thread(
-                target=recognize_and_enqueue,
-                args=(full_audio_data,),
-                daemon=True
-            ).start()
+        if speech_recognizer:
+            # 已录制的数据块大多已在录音期间识别完毕，这里只需处理剩余部分
+            speech_recognizer.finish()
+            speech_recognizer = None
 
-        except ValueError as e:
-            print(f"[录音处理错误] 合并音频块失败 (可能为空或格式错误): {e}")
-            audio_buffers = []
-        except Exception as e:
-            print(f"[录音处理错误] 处理音频数据时发生未知错误: {e}")
-            audio_buffers = []
 
+def listen_callback(indata: np.ndarray, frames: int, time_info, status):
 
-def load_frames(json_list):
-    frames = []
-    init_joints = {}
-    first = True
-    w = h = 0
+    if status:
+        print(f"[录音警告] {status}")
+    if hands_free_listener:
+        hands_free_listener.feed(indata.copy())
 
-    for p_str in json_list:
-        p = Path(p_str)
-        if not p.exists():
-            print(f"[WARN] 动作文件未找到: {p_str}")
-            continue
+def toggle_listening():
+    """开启/关闭免提模式：麦克风常开，端点检测切分语句后自动提交。"""
+    global is_listening, rec_stream, hands_free_listener, last_recognized_text, recognized_text_timer
+    if not vosk_model:
+        print("[警告] Vosk 模型未加载，无法启动免提模式。")
+        last_recognized_text = "语音识别不可用" if vosk_ready.is_set() else "语音模型加载中，请稍候"
+        recognized_text_timer = RECOGNIZED_TEXT_DURATION
+        return
 
+    if not is_listening:
         try:
-            with open(p, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"[WARN] 无法读取或解析动作文件 {p_str}: {e}")
-            continue
-
-        cur = data.get('frames', [])
-        if not cur:
-
-            print(f"[WARN] 动作文件 {p_str} 没有帧数据。")
-            continue
-
-        video_info = data.get('video_info', {})
-        w, h = video_info.get('resolution', (w, h))
-
-        for fr in cur:
-            j = fr.get('joints', {})
-            if 'right_elbow' in j:     j['right_elbow']['y'] += 15
-            if 'left_elbow'  in j:     j['left_elbow']['y']  += 15
-            if 'right_shoulder' in j and 'left_shoulder' in j:
-                mid = (j['right_shoulder']['x'] + j['left_shoulder']['x']) / 2
-                j['right_shoulder']['x'], j['left_shoulder']['x'] = mid - 30, mid
-                j['left_shoulder']['x'] = mid
-
-        if first:
-            first_frame = cur[0] if cur else {}
-            pelvis = first_frame.get('joints', {}).get('pelvis')
-
-            if pelvis:
-                offx, offy = w//2 - pelvis['x'], h//2 - pelvis['y']
-                for fr in cur:
-                     for pos in fr.get('joints', {}).values():
-                        pos['x'] += offx; pos['y'] += offy
-                first_frame_joints_centered = cur[0].get('joints', {})
-                for name,pos in first_frame_joints_centered.items():
-                    init_joints[name] = {'x':pos['x'],'y':pos['y']}
-                first = False
-
-            else:
-                print(f"[WARN] 首段动作文件 {p_str} 的第一帧没有 'pelvis' 关节，无法居中和记录基线。后续拼接可能受影响。")
-                first = False
-
-        else:
-
-            last_pelvis = frames[-1].get('joints', {}).get('pelvis') if frames else None
-            start_pelvis = cur[0].get('joints', {}).get('pelvis')
-
-            if last_pelvis and start_pelvis:
-                dx, dy = last_pelvis['x']-start_pelvis['x'], last_pelvis['y']-start_pelvis['y']
-                for fr in cur:
-                    for pos in fr.get('joints', {}).values():
-                        pos['x'] += dx; pos['y'] += dy
-            elif frames:
-                 print(f"[WARN] 动作文件 {p_str} 无法与上一段对齐：缺少骨盆关节信息。")
-
-        frames.extend(cur)
-
-    if not init_joints and frames:
-         first_valid_joints = next((fr.get('joints', {}) for fr in frames if fr.get('joints')), None)
-         if first_valid_joints:
-             for name,pos in first_valid_joints.items():
-                 init_joints[name] = {'x':pos['x'],'y':pos['y']}
-             print("[WARN] 未能使用骨盆关节设置初始基线 (init_joints)，使用首个有效帧的关节作为近似基线。动画定位和缩放可能不准确。")
-         else:
-              print("[ERROR] 无法确定初始关节基线。请检查动作文件是否包含关节数据。")
-
+            hands_free_listener = HandsFreeListener(
+                vosk_model, REC_FS,
+                on_partial=on_partial_recognition,
+                on_utterance=on_final_recognition,
+                endpointer=EnergyEndpointer(threshold_db=VAD_THRESHOLD_DB, hangover_blocks=VAD_HANGOVER_BLOCKS),
+            ).start()
+            rec_stream = sd.InputStream(
+                samplerate=REC_FS,
+                channels=REC_CHANNELS,
+                blocksize=REC_BLOCKSIZE,
+                dtype="int16",
+                callback=listen_callback
+            )
+            rec_stream.start()
+            is_listening = True
+            print("[免提] 麦克风已开启，检测到说话时自动识别并提交。")
+        except Exception as e:
+            print(f"[录音错误] 无法启动免提监听: {e}")
+            if hands_free_listener:
+                hands_free_listener.stop()
+                hands_free_listener = None
+            rec_stream = None
+    else:
+        is_listening = False
+        if rec_stream:
+            try:
+                rec_stream.stop()
+                rec_stream.close()
+            except Exception as e:
+                print(f"[录音错误] 关闭录音流时出错: {e}")
+            finally:
+                rec_stream = None
+        if hands_free_listener:
+            print(f"[免提] 已关闭。统计: {hands_free_listener.stats()}")
+            hands_free_listener.stop()
+            hands_free_listener = None
 
-    return frames, init_joints, w, h
 
 def pygame_loop():
     global is_recording, last_recognized_text, recognized_text_timer, input_text, typing
 
     print("初始化 Pygame 及资源...")
+    phase_start = time.perf_counter()
     pygame.init()
     initialize_fonts()
-    print("加载 Idle 动作...")
+    record_startup_phase("pygame_init", time.perf_counter() - phase_start)
+    phase_start = time.perf_counter()
+    print("等待 Idle 动作加载...")
     try:
-        idle_action_key = "空闲" if "空闲" in ACTION_MAP else ("常态" if "常态" in ACTION_MAP else None)
-        if not idle_action_key or not ACTION_MAP.get(idle_action_key):
-            raise ValueError("ACTION_MAP 中未定义有效的 '空闲' 或 '常态' 动作。")
-
-        idle_json_name = ACTION_MAP[idle_action_key]
-        idle_file = Path(f"actions/{idle_json_name}.json")
-        if not idle_file.exists():
-            raise FileNotFoundError(f"必需的 Idle/Normal 动画文件未找到: {idle_file}")
-
-        idle_frames, initial_joints_idle_original, w, h = load_frames([str(idle_file)])
-
-        if not idle_frames:
-            raise ValueError("Idle 动画加载失败或为空。")
+        idle_action_key = next((k for k in ("空闲", "常态") if action_library.wait(k) is not None), None)
+        if not idle_action_key:
+            raise ValueError("ACTION_MAP 中的 '空闲' 和 '常态' 动作均不可用。")
+
+        idle_clip = action_library.get(idle_action_key)
+        w, h = idle_clip.resolution
+        idle_frames = action_library.sequence([idle_action_key], w, h)
+        initial_joints_idle_original = idle_frames.frame(0).copy()
         print(f"Idle 动作加载成功 ({len(idle_frames)} 帧), 窗口尺寸: {w}x{h}")
+        record_startup_phase("idle_clip", time.perf_counter() - phase_start)
+        phase_start = time.perf_counter()
 
     except Exception as e:
         print(f"[致命错误] 加载 Idle 动画失败: {e}")
@@ -469,6 +571,7 @@ def pygame_loop():
         print(f"[错误] 加载角色素材失败: {e}")
         mats = {}
 
+    record_startup_phase("window_assets", time.perf_counter() - phase_start)
     clock = pygame.time.Clock()
 
 
@@ -494,37 +597,65 @@ def pygame_loop():
 
     # 状态和位置初始化
     state = 'idle'
-    idle_idx = 0
-    action_idx = 0
-    action_frames = []
-    action_initial_joints = {}
+    idle_time = 0.0    # 秒
+    action_time = 0.0  # 秒
+    action_frames = MotionClip.stitch([])
+    pending_request = None
+    shown_stream_version = streaming_version
     text_reply = ""
     typing = False
     input_text = ""
-    input_mode = "text" # 当前输入模式: "text" 或 "voice"
+    input_mode = "text" # 当前输入模式: "text"、"voice" 或 "hands_free"
 
-    initial_pelvis_original = initial_joints_idle_original.get('pelvis', {'x': 0, 'y': 0})
     center_x, center_y = w // 2, h // 2
-    initial_offset_x = center_x - initial_pelvis_original['x']
-    initial_offset_y = center_y - initial_pelvis_original['y']
+    idle_origin_pelvis = idle_frames.pelvis(0) or (center_x, center_y)
+    initial_offset = np.array([center_x - idle_origin_pelvis[0], center_y - idle_origin_pelvis[1]], dtype=np.float32)
+
+    idle_last_pelvis = idle_frames.pelvis(-1)
+    last_pelvis_abs = (
+        (idle_last_pelvis[0] + initial_offset[0], idle_last_pelvis[1] + initial_offset[1])
+        if idle_last_pelvis else (center_x, center_y)
+    )
+
+    current_offset = initial_offset
+
+    # 姿态过渡：状态切换后的 blend_duration 秒内从上一帧渲染的姿态渐变过去
+    blend_duration = BLEND_FRAMES / idle_frames.fps
+    blend_from = None
+    blend_time = blend_duration
+    last_rendered = None
+    last_frame_state = None
 
-    last_pelvis_abs = {
-        'x': idle_frames[-1]['joints']['pelvis']['x'] + initial_offset_x,
-        'y': idle_frames[-1]['joints']['pelvis']['y'] + initial_offset_y
-    } if 'pelvis' in idle_frames[-1].get('joints', {}) else {'x': center_x, 'y': center_y}
+    def apply_quality(level):
+        pg_base.sprite_cache.angle_step = level["angle_step"]
+        print(f"[渲染] 质量等级 -> {governor.level}: 旋转步长 {level['angle_step']}°, 目标帧率 {level['fps']}")
 
-    current_offset = {'x': initial_offset_x, 'y': initial_offset_y}
+    governor = FrameGovernor(max_fps=FPS, on_change=apply_quality)
+    pg_base.sprite_cache.angle_step = governor.angle_step
+
+    screen_rect = screen.get_rect()
+    prev_puppet_rect = None
+    prev_ui_items = set()
+    dirty_fraction = 1.0
+    full_redraw = True
 
     print("初始化完成，开始主循环...")
+    first_frame = True
     running = True
     while running:
-        delta_time = clock.tick(FPS) / 1000.0 
+        delta_time = min(clock.tick(governor.fps) / 1000.0, MAX_FRAME_TIME)
+        if FRAME_GOVERNOR and not first_frame:
+            # get_rawtime 为上一帧的实际工作耗时，不含 tick 的等待
+            governor.record(clock.get_rawtime() / 1000.0)
 
         for ev in pygame.event.get():
             if ev.type == pygame.QUIT:
                 running = False
                 break
 
+            if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                full_redraw = True
+
             if ev.type == pygame.MOUSEBUTTONDOWN:
                 if ev.button == 1:
                     if input_mode == "text":
@@ -548,11 +679,17 @@ def pygame_loop():
                                 typing = False
                                 pygame.key.stop_text_input()
                                 input_text = ""
+                        elif input_mode == "voice":
+                            input_mode = "hands_free"
+                            print("切换到 -> 免提模式")
+                            if is_recording:
+                                toggle_recording()
+                            toggle_listening()
                         else:
                             input_mode = "text"
                             print("切换到 -> 文字模式")
-                            if is_recording:
-                                toggle_recording()
+                            if is_listening:
+                                toggle_listening()
                         last_recognized_text = ""
                         recognized_text_timer = 0
 
@@ -571,7 +708,7 @@ def pygame_loop():
                          print("输入框已取消激活 (Tab)。")
                          if input_text.strip():
                              print(f"提交文本 (Tab): {input_text.strip()}")
-                             threading.Thread(target=process_and_enqueue, args=(input_text.strip(),), daemon=True).start()
+                             process_and_enqueue(input_text.strip())
                          input_text = ""
 
                 elif typing and input_mode == "text":
@@ -580,7 +717,7 @@ def pygame_loop():
                         pygame.key.stop_text_input()
                         typing = False
                         if input_text.strip():
-                            threading.Thread(target=process_and_enqueue, args=(input_text.strip(),), daemon=True).start()
+                            process_and_enqueue(input_text.strip())
                         input_text = ""
                     elif ev.key == pygame.K_BACKSPACE:
                         input_text = input_text[:-1]
@@ -594,100 +731,83 @@ def pygame_loop():
                 input_text += ev.text
 
         if not running: break
-        if state == 'idle' and not action_queue.empty():
-            acts, reply = action_queue.get()
-            text_reply = reply
-
-            json_list = []
-            valid_action_found = False
-            for action_name in acts:
-                action_name_clean = action_name.strip().strip("'\"")
-                p = Path(action_name_clean)
-
-                potential_path = None
-                if p.suffix.lower() == '.json':
-                    potential_path = p
-                elif p.parent != Path('.'):
-                    potential_path = p.with_suffix('.json')
-                else:
+        if state == 'idle' and (pending_request or not action_queue.empty()):
+            acts, reply = pending_request or action_queue.get()
+            pending_request = None
 
-                    direct_path = Path(f"actions/{action_name_clean}.json")
-                    if direct_path.exists():
-                        potential_path = direct_path
+            if any(action_library.is_loading(a) for a in acts):
+                # 动作库仍在后台加载，下一帧再试，渲染线程不等待文件 I/O
+                pending_request = (acts, reply)
+            else:
+                if reply is not None:
+                    text_reply = reply
+
+                action_list = []
+                for action_name in acts:
+                    if action_library.get(action_name) is not None:
+                        action_list.append(action_name)
                     else:
-                        mapped_filename = ACTION_MAP.get(action_name_clean)
-                        if mapped_filename:
-                            mapped_path = Path(f"actions/{mapped_filename}.json")
-                            if mapped_path.exists():
-                                potential_path = mapped_path
-                            else:
-                                print(f"[警告] 动作 '{action_name_clean}' 映射的文件未找到: {mapped_path}")
-                        else:
-                             print(f"[警告] 动作 '{action_name_clean}' 既不是有效文件名也不是映射名。")
-
-                if potential_path and potential_path.exists():
-                     json_list.append(str(potential_path))
-                     valid_action_found = True
-                elif potential_path:
-                     print(f"[警告] 构造的动作文件路径不存在: {potential_path}")
-
-
-            if json_list and valid_action_found:
-                print(f"加载新动作序列: {json_list}")
-                loaded_frames, first_segment_joints_original, loaded_w, loaded_h = load_frames(json_list)
-
-                if loaded_frames:
-                    action_frames = loaded_frames
-                    action_initial_joints = first_segment_joints_original
-
-                    raw_start_pelvis = action_initial_joints.get('pelvis', {'x': loaded_w // 2, 'y': loaded_h // 2})
-
-                    action_offset = {
-                        'x': last_pelvis_abs['x'] - raw_start_pelvis['x'],
-                        'y': last_pelvis_abs['y'] - raw_start_pelvis['y'],
-                    }
-                    current_offset = action_offset
-
-                    last_frame_pelvis_relative = action_frames[-1]['joints'].get('pelvis', raw_start_pelvis)
-                    last_pelvis_abs = {
-                        'x': last_frame_pelvis_relative['x'] + action_offset['x'],
-                        'y': last_frame_pelvis_relative['y'] + action_offset['y'],
-                    }
-                    state = 'action'
-                    action_idx = 0
-                    output_visible = bool(text_reply)
-                    output_fade_timer = OUTPUT_FADE_DURATION if output_visible else 0
-                    print(f"切换到 Action 状态, {len(action_frames)} 帧。新的 last_pelvis_abs: ({last_pelvis_abs['x']:.1f}, {last_pelvis_abs['y']:.1f})")
-                else:
-                    print("[警告] 动作加载失败 (返回空帧列表)，返回 Idle。")
-                    state = 'idle'
-                    idle_idx = 0
-                    text_reply = "抱歉，我好像动不了了。"
-                    output_visible = True
-                    output_fade_timer = OUTPUT_FADE_DURATION
+                        print(f"[警告] 动作 '{action_name}' 不在动作库中或加载失败，将忽略。")
+
+                if action_list:
+                    print(f"播放新动作序列: {action_list}")
+                    loaded_frames = action_library.sequence(action_list, w, h, blend_frames=BLEND_FRAMES)
+
+                    if loaded_frames:
+                        action_frames = loaded_frames
+
+                        raw_start_pelvis = action_frames.pelvis(0) or (w // 2, h // 2)
+                        action_offset = np.array([
+                            last_pelvis_abs[0] - raw_start_pelvis[0],
+                            last_pelvis_abs[1] - raw_start_pelvis[1],
+                        ], dtype=np.float32)
+                        current_offset = action_offset
+
+                        last_frame_pelvis_relative = action_frames.pelvis(-1) or raw_start_pelvis
+                        last_pelvis_abs = (
+                            last_frame_pelvis_relative[0] + action_offset[0],
+                            last_frame_pelvis_relative[1] + action_offset[1],
+                        )
+                        state = 'action'
+                        action_time = 0.0
+                        output_visible = bool(text_reply)
+                        output_fade_timer = OUTPUT_FADE_DURATION if output_visible else 0
+                        print(f"切换到 Action 状态, {len(action_frames)} 帧。新的 last_pelvis_abs: ({last_pelvis_abs[0]:.1f}, {last_pelvis_abs[1]:.1f})")
+                    else:
+                        print("[警告] 动作拼接结果为空，返回 Idle。")
+                        state = 'idle'
+                        idle_time = 0.0
+                        text_reply = "抱歉，我好像动不了了。"
+                        output_visible = True
+                        output_fade_timer = OUTPUT_FADE_DURATION
 
-            else:
-                print("[警告] 请求的动作未找到有效的动作文件，保持 Idle。")
-                if not valid_action_found and acts:
-                     text_reply = "我好像不认识这个动作。"
-                     output_visible = True
-                     output_fade_timer = OUTPUT_FADE_DURATION
+                else:
+                    print("[警告] 请求的动作未找到有效的动作文件，保持 Idle。")
+                    if acts:
+                         text_reply = "我好像不认识这个动作。"
+                         output_visible = True
+                         output_fade_timer = OUTPUT_FADE_DURATION
+
+        if shown_stream_version != streaming_version:
+            shown_stream_version = streaming_version
+            text_reply = streaming_reply
+            output_visible = bool(text_reply)
+            output_fade_timer = OUTPUT_FADE_DURATION if output_visible else 0
 
         frame_joint_data_original = None
+        frame_state = state
         if state == 'idle':
             if not idle_frames:
                  print("[错误] Idle 帧丢失!")
                  time.sleep(0.1)
                  continue
 
-            frame_joint_data_original = idle_frames[idle_idx]['joints']
-            idle_idx = (idle_idx + 1) % len(idle_frames)
-            idle_origin_pelvis = initial_joints_idle_original.get('pelvis', {'x': w // 2, 'y': h // 2})
-            idle_global_offset = {
-                'x': last_pelvis_abs['x'] - idle_origin_pelvis['x'],
-                'y': last_pelvis_abs['y'] - idle_origin_pelvis['y'],
-            }
-            current_offset = idle_global_offset
+            frame_joint_data_original = idle_frames.sample(idle_time, loop=True)
+            idle_time = (idle_time + delta_time) % idle_frames.duration
+            current_offset = np.array([
+                last_pelvis_abs[0] - idle_origin_pelvis[0],
+                last_pelvis_abs[1] - idle_origin_pelvis[1],
+            ], dtype=np.float32)
 
             if output_visible and not text_reply:
                 if output_fade_timer > 0:
@@ -699,97 +819,58 @@ def pygame_loop():
             if not action_frames:
                  print("[错误] Action 帧丢失!")
                  state = 'idle'
-                 idle_idx = 0
+                 idle_time = 0.0
                  continue
 
-            frame_joint_data_original = action_frames[action_idx]['joints']
-            action_idx += 1
+            frame_joint_data_original = action_frames.sample(action_time)
+            action_time += delta_time
 
-            if action_idx >= len(action_frames):
+            if action_time >= action_frames.duration:
                 print("Action 播放完毕，返回 Idle。")
                 state = 'idle'
-                idle_idx = 0
-
-        joints_for_render = {}
-        if frame_joint_data_original:
-            joints_for_render = {
-                joint_name: {
-                    'x': original_pos['x'] + current_offset['x'],
-                    'y': original_pos['y'] + current_offset['y'],
-                }
-                for joint_name, original_pos in frame_joint_data_original.items()
-                if original_pos
-            }
+                idle_time = 0.0
+
+        joints_for_render = None
+        if frame_joint_data_original is not None:
+            joints_for_render = frame_joint_data_original + current_offset
+            if frame_state != last_frame_state and last_rendered is not None:
+                blend_from, blend_time = last_rendered, 0.0
+            if blend_time < blend_duration:
+                blend_time += delta_time
+                joints_for_render = crossfade(
+                    blend_from, joints_for_render[None], [smoothstep(blend_time / blend_duration)]
+                )[0]
+            last_rendered, last_frame_state = joints_for_render, frame_state
         else:
              print("[警告] 当前帧缺少关节点数据！")
              pass
 
 
-        screen.blit(bg, (0, 0))
+        # 脏矩形渲染：只在角色前后两帧的外接矩形及发生变化的界面元素区域内重绘
+        puppet = []
+        puppet_rect = None
+        if mats and joints_for_render is not None:
+            puppet, puppet_rect = pg_base.puppet_blits(screen, mats, joints_for_render, initial_joints_idle_original)
 
-        if mats and joints_for_render:
-            pg_base.render(
-                screen, bg, mats,
-                joints_for_render,
-                initial_joints_idle_original,
-                frame_idx=0
-            )
-        elif not mats:
-             pass
+        ui_items = []  # (内容签名, 区域, 绘制函数)，按绘制顺序排列
 
         if output_visible and text_reply:
-            max_text_width = w * 0.65
-            padding_x = 20
-            padding_y = 15
-            line_spacing = 6
-
-            wrapped_lines = []
-            current_line = ""
-            for char in text_reply:
-                test_line = current_line + char
-                rect = main_font.get_rect(test_line)
-                if rect.width < max_text_width:
-                    current_line = test_line
-                else:
-                    wrapped_lines.append(current_line)
-                    current_line = char
-            if current_line:
-                wrapped_lines.append(current_line)
-
-            text_rects = [main_font.get_rect(line) for line in wrapped_lines]
-            total_text_height = sum(r.height for r in text_rects) + max(0, len(wrapped_lines) - 1) * line_spacing
-            max_line_width = max(r.width for r in text_rects) if text_rects else 0
-
-            output_box_width_needed = max_line_width + 2 * padding_x
-            output_box_height_needed = total_text_height + 2 * padding_y
-
-            final_output_box_width = min(max(output_box_width_needed, 150), w - 40)
-            final_output_box_height = min(max(output_box_height_needed, 50), h // 2.5)
-            final_output_box_x = (w - final_output_box_width) // 2
-            final_output_box_y = 20
-            output_box_rect = pygame.Rect(final_output_box_x, final_output_box_y, final_output_box_width, final_output_box_height)
-
-            output_box_img = create_output_box(final_output_box_width, final_output_box_height)
+            output_box_img = render_output_box(text_reply, main_font, w * 0.65, w - 40, h // 2.5)
+            output_box_rect = output_box_img.get_rect(topleft=((w - output_box_img.get_width()) // 2, 20))
             alpha = int(min(1.0, output_fade_timer / OUTPUT_FADE_DURATION) * UI_COLORS["output_bg"][3])
-            output_box_img.set_alpha(alpha)
-
-            screen.blit(output_box_img, output_box_rect.topleft)
-
-            if alpha > 200:
-                current_y = final_output_box_y + padding_y
-                for i, line in enumerate(wrapped_lines):
-                     main_font.render_to(screen,
-                                         (final_output_box_x + padding_x, current_y),
-                                         line,
-                                         UI_COLORS["text"])
-                     current_y += text_rects[i].height + line_spacing
+            ui_items.append((
+                ("output", text_reply, alpha), output_box_rect,
+                lambda box=output_box_img, pos=output_box_rect.topleft, a=alpha: blit_with_alpha(screen, box, pos, a),
+            ))
 
         elif output_visible and output_fade_timer > 0:
             output_fade_timer -= 1
             if output_box_img and output_box_rect:
                  alpha = int(min(1.0, output_fade_timer / OUTPUT_FADE_DURATION) * UI_COLORS["output_bg"][3])
-                 output_box_img.set_alpha(alpha)
-                 screen.blit(output_box_img, output_box_rect.topleft)
+                 ui_items.append((
+                     ("output", None, alpha), output_box_rect,
+                     lambda box=output_box_img, pos=output_box_rect.topleft, a=alpha: blit_with_alpha(screen, box, pos, a),
+                 ))
             if output_fade_timer <= 0:
                  output_visible = False
                  output_box_img = None
@@ -797,51 +878,125 @@ def pygame_loop():
 
 
         if input_mode == "text":
-             screen.blit(input_box_img, input_box_rect.topleft)
-             text_render_x = input_box_rect.x + input_text_offset_x
-             text_render_y = input_box_rect.y + input_text_offset_y
-
-             if typing:
-                 input_font.render_to(screen, (text_render_x, text_render_y), input_text, UI_COLORS["text"])
-                 if int(time.time() * 2) % 2 == 0:
-                     text_surface, text_rect = input_font.render(input_text)
-                     cursor_x = text_render_x + text_rect.width + 1
-                     cursor_y1 = text_render_y
-                     cursor_y2 = text_render_y + input_font.get_sized_height(18)
-                     pygame.draw.line(screen, UI_COLORS["dark_red"], (cursor_x, cursor_y1), (cursor_x, cursor_y2), 2)
-             elif not input_text:
-                 input_font.render_to(screen, (text_render_x, text_render_y), INPUT_HINT, UI_COLORS["hint_text"])
-
-        button_color = UI_COLORS["gold"] if input_mode == "voice" else UI_COLORS["button_text"]
-        pygame.draw.rect(screen, button_color, button_rect, border_radius=8)
-        button_text = "语音模式" if input_mode == "voice" else "文字模式"
-        btn_text_color = UI_COLORS["text_light"]
-        text_surf, text_rect = input_font.render(button_text, btn_text_color)
-        text_rect.center = button_rect.center
-        screen.blit(text_surf, text_rect)
-
+             cursor_on = typing and int(time.time() * 2) % 2 == 0
+
+             def draw_input(text=input_text, active=typing, cursor=cursor_on):
+                 screen.blit(input_box_img, input_box_rect.topleft)
+                 text_render_x = input_box_rect.x + input_text_offset_x
+                 text_render_y = input_box_rect.y + input_text_offset_y
+                 if active:
+                     draw_text(screen, input_font, (text_render_x, text_render_y), text, UI_COLORS["text"])
+                     if cursor:
+                         text_rect = input_font.get_rect(text)
+                         cursor_x = text_render_x + text_rect.width + 1
+                         cursor_y1 = text_render_y
+                         cursor_y2 = text_render_y + input_font.get_sized_height(18)
+                         pygame.draw.line(screen, UI_COLORS["dark_red"], (cursor_x, cursor_y1), (cursor_x, cursor_y2), 2)
+                 elif not text:
+                     draw_text(screen, input_font, (text_render_x, text_render_y), INPUT_HINT, UI_COLORS["hint_text"])
+             ui_items.append((("input", input_text, typing, cursor_on), input_box_rect, draw_input))
+
+        button_color = UI_COLORS["gold"] if input_mode != "text" else UI_COLORS["button_text"]
+        button_text = {"voice": "语音模式", "hands_free": "免提模式"}.get(input_mode, "文字模式")
+
+        def draw_button(color=button_color, label=button_text):
+            pygame.draw.rect(screen, color, button_rect, border_radius=8)
+            text_surf, text_rect = input_font.render(label, UI_COLORS["text_light"])
+            text_rect.center = button_rect.center
+            screen.blit(text_surf, text_rect)
+        ui_items.append((("button", button_text), button_rect, draw_button))
+
+        rec_status_text = None
         if input_mode == "voice":
-             rec_indicator_x = button_rect.left + 150
-             rec_indicator_y = button_rect.centery
              rec_color = UI_COLORS["recording_active"] if is_recording else UI_COLORS["recording_idle"]
-             pygame.draw.circle(screen, rec_color, (rec_indicator_x, rec_indicator_y), 7)
              rec_status_text = "录音中..." if is_recording else "按 '空格' 开始录音"
-             status_font.render_to(screen,
-                                  (rec_indicator_x + 12, rec_indicator_y - 10),
-                                  rec_status_text,
-                                  rec_color)
+        elif input_mode == "hands_free":
+             speaking = bool(hands_free_listener and hands_free_listener.in_speech)
+             rec_color = UI_COLORS["recording_active"] if speaking else UI_COLORS["recording_idle"]
+             rec_status_text = "正在听..." if speaking else ("等待说话" if is_listening else "麦克风不可用")
+        if rec_status_text:
+             rec_indicator_x = button_rect.left + 150
+             rec_indicator_y = button_rect.centery
+             status_rect = status_font.get_rect(rec_status_text)
+             rec_rect = pygame.Rect(rec_indicator_x - 8, rec_indicator_y - 12,
+                                    20 + status_rect.width, max(24, status_rect.height + 4)).inflate(8, 8)
+
+             def draw_rec_status(color=rec_color, label=rec_status_text, x=rec_indicator_x, y=rec_indicator_y):
+                 pygame.draw.circle(screen, color, (x, y), 7)
+                 draw_text(screen, status_font, (x + 12, y - 10), label, color)
+             ui_items.append((("rec", rec_status_text, rec_color), rec_rect, draw_rec_status))
 
         if recognized_text_timer > 0:
              recognized_text_timer -= 1
              if last_recognized_text:
                  rec_text_surf, rec_text_rect = status_font.render(f"识别: {last_recognized_text}", UI_COLORS["recognized_text"])
                  rec_text_rect.topright = (w - 15, 15)
-                 screen.blit(rec_text_surf, rec_text_rect)
-
-        pygame.display.flip()
+                 ui_items.append((
+                     ("recognized", last_recognized_text), rec_text_rect,
+                     lambda surf=rec_text_surf, rect=rec_text_rect: screen.blit(surf, rect),
+                 ))
+
+        if not (agent_ready.is_set() and vosk_ready.is_set()):
+             ready_states = (("对话系统", agent_ready.is_set()), ("语音模型", vosk_ready.is_set()))
+
+             def draw_ready(states=ready_states):
+                 ready_y = 15
+                 for label, ready in states:
+                     ready_color = UI_COLORS["recording_active"] if ready else UI_COLORS["recording_idle"]
+                     pygame.draw.circle(screen, ready_color, (22, ready_y + 8), 5)
+                     draw_text(screen, status_font, (32, ready_y), f"{label}{'已就绪' if ready else '加载中...'}", ready_color)
+                     ready_y += 22
+             ready_width = max(status_font.get_rect(f"{label}加载中...").width for label, _ in ready_states)
+             ui_items.append((("ready", ready_states), pygame.Rect(10, 10, ready_width + 40, 22 * len(ready_states) + 10), draw_ready))
+
+        if SHOW_FRAME_STATS:
+             frame_ms = governor.percentiles()
+             stats_text = f"Q{governor.level} {governor.fps}fps 脏区 {dirty_fraction:.0%} " + " ".join(f"{k} {v:.1f}ms" for k, v in frame_ms.items())
+             stats_rect = status_font.get_rect(stats_text)
+             ui_items.append((
+                 ("stats", stats_text), pygame.Rect(15, h - 25, stats_rect.width, stats_rect.height).inflate(8, 8),
+                 lambda text=stats_text: draw_text(screen, status_font, (15, h - 25), text, UI_COLORS["recognized_text"]),
+             ))
+
+        if pg_base.DEBUG_MODE:
+             cache = pg_base.sprite_cache.stats()
+             cache_text = f"Sprite cache: {cache['hits']} hit / {cache['misses']} miss ({cache['hit_rate']:.1%})"
+             cache_rect = status_font.get_rect(cache_text)
+             cache_pos = (input_box_rect.left, input_box_rect.top - cache_rect.height - 10)
+             ui_items.append((
+                 ("sprite_cache", cache_text), pygame.Rect(cache_pos, cache_rect.size).inflate(8, 8),
+                 lambda text=cache_text, pos=cache_pos: draw_text(screen, status_font, pos, text, UI_COLORS["recognized_text"]),
+             ))
+
+        if full_redraw:
+            full_redraw = False
+            dirty = [screen_rect.copy()]
+        else:
+            dirty = [r for r in (prev_puppet_rect, puppet_rect) if r is not None]
+            shown = {(key, tuple(rect)) for key, rect, _ in ui_items}
+            dirty.extend(pygame.Rect(rect) for key, rect in shown ^ prev_ui_items)
+            dirty = pg_base.merge_rects(dirty, screen_rect)
+        for region in dirty:
+            screen.set_clip(region)
+            screen.blit(bg, region, region)
+            screen.blits(puppet, doreturn=False)
+            for _, rect, draw in ui_items:
+                if rect.colliderect(region):
+                    draw()
+        screen.set_clip(None)
+        prev_puppet_rect = puppet_rect
+        prev_ui_items = {(key, tuple(rect)) for key, rect, _ in ui_items}
+        dirty_fraction = sum(r.width * r.height for r in dirty) / (w * h)
+
+        pygame.display.update(dirty)
+        if first_frame:
+            first_frame = False
+            record_startup_phase("first_frame", time.perf_counter() - PROCESS_START)
 
 
     print("退出 Pygame 主循环...")
+    print(f"[渲染] 帧率调节统计: {governor.stats()}")
+    print(f"[渲染] 旋转缓存统计: {pg_base.sprite_cache.stats()}")
     if rec_stream:
         try:
             if not rec_stream.closed:
@@ -866,8 +1021,10 @@ last_check_time = time.time()
 
 if __name__ == "__main__":
     print("程序启动...")
-    initialize_agent_system()
-    initialize_vosk_model()
+    action_library.start()
+    agent_worker.start()
+    run_startup_task("agent_system", initialize_agent_system, agent_ready)
+    run_startup_task("vosk_model", initialize_vosk_model, vosk_ready)
 
     try:
         pygame_loop()
@@ -881,6 +1038,11 @@ if __name__ == "__main__":
 
 
     finally:
+        agent_worker.stop()
+        if dh_system:
+            print(f"[Agent] 延迟统计: {dh_system.latency_report()}")
+            print(f"[Agent] 连接复用: {dh_system.connection_stats()}")
+            dh_system.close()
         if pygame.get_init():
             pygame.quit()
             print("在 finally 块中强制退出 Pygame。")
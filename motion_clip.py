@@ -0,0 +1,404 @@
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 采样脚本输出的关节顺序，所有动作片段都映射到这一固定顺序
+JOINT_NAMES = [
+    "nose", "left_shoulder", "right_shoulder", "left_elbow", "right_elbow",
+    "left_wrist", "right_wrist", "left_hip", "right_hip", "left_knee",
+    "right_knee", "left_ankle", "right_ankle", "pelvis", "thorax",
+    "upper_neck", "head_top",
+]
+JOINT_INDEX = {name: i for i, name in enumerate(JOINT_NAMES)}
+PELVIS = JOINT_INDEX["pelvis"]
+
+# 预编译缓存：actions/xxx.json -> actions/.clipcache/xxx.npy + xxx.meta.json
+CACHE_DIR_NAME = ".clipcache"
+CACHE_VERSION = 1
+# 当前 umask 只能通过设置再恢复来读取；在导入时读取一次，避免在加载线程中临时改动进程 umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# 动作文件格式，按查找顺序：JSON、JSON Lines（首行为 video_info）、二进制 .npy（附 .meta.json）
+CLIP_SUFFIXES = (".json", ".jsonl", ".npy")
+# .npy 动作文件旁边的元数据文件，不是动作片段
+META_SUFFIX = ".meta.json"
+
+
+def joints_to_array(joints):
+    """把一帧的关节字典 {名称: {"x", "y"}} 转成 (关节数, 2) 数组，缺失关节为 NaN。"""
+    positions = np.full((len(JOINT_NAMES), 2), np.nan, dtype=np.float32)
+    for name, pos in joints.items():
+        j = JOINT_INDEX.get(name)
+        if j is not None and pos:
+            positions[j, 0] = pos["x"]
+            positions[j, 1] = pos["y"]
+    return positions
+
+
+def interpolate_keyframes(frame_numbers, keys, count):
+    """把关键帧 (关键帧数, 关节数, 2) 按 frame_numbers 线性插值回 count 帧。
+
+    某一侧关节缺失时取较近的关键帧，首个关键帧之前和最后一个之后保持不变。
+    """
+    idx = np.asarray(frame_numbers, dtype=np.int64)
+    keys = np.asarray(keys, dtype=np.float32)
+    if len(idx) == 1:
+        return np.repeat(keys, count, axis=0)
+    t = np.arange(count)
+    hi = np.clip(np.searchsorted(idx, t, side="right"), 1, len(idx) - 1)
+    lo = hi - 1
+    frac = np.clip((t - idx[lo]) / (idx[hi] - idx[lo]), 0.0, 1.0).astype(np.float32)[:, None, None]
+    a, b = keys[lo], keys[hi]
+    blended = a + (b - a) * frac
+    return np.where(np.isnan(blended), np.where(frac < 0.5, a, b), blended)
+
+
+def find_clip(action_dir, name):
+    """在 action_dir 中按 CLIP_SUFFIXES 顺序查找动作文件，找不到时返回 None。"""
+    for suffix in CLIP_SUFFIXES:
+        path = Path(action_dir) / f"{name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+class MotionClip:
+    """动作片段：positions 为 (帧数, 关节数, 2) 的 float32 数组，缺失关节为 NaN。
+
+    关节顺序固定为 JOINT_NAMES，可通过 joint_index 查找下标。
+    segments 记录拼接来源 [(来源, 起始帧, 结束帧), ...]。
+    """
+
+    joint_names = JOINT_NAMES
+    joint_index = JOINT_INDEX
+
+    def __init__(self, positions, fps=30.0, resolution=(0, 0), source=None, segments=None):
+        self.positions = np.asarray(positions, dtype=np.float32)
+        self.fps = float(fps)
+        self.resolution = tuple(resolution)
+        self.source = source
+        self.segments = segments if segments is not None else [(source, 0, len(self.positions))]
+
+    @classmethod
+    def from_dict(cls, data, source=None):
+        frames = data.get("frames", [])
+        video_info = data.get("video_info", {})
+        positions = np.full((len(frames), len(JOINT_NAMES), 2), np.nan, dtype=np.float32)
+        for i, fr in enumerate(frames):
+            positions[i] = joints_to_array(fr.get("joints", {}))
+        if video_info.get("keyframes") and frames:
+            # 关键帧压缩后的动作（motion_filter.py），加载时插值回完整帧序列
+            positions = interpolate_keyframes(
+                [fr["frame_number"] for fr in frames], positions,
+                video_info.get("frame_count", frames[-1]["frame_number"] + 1),
+            )
+        return cls(
+            positions,
+            fps=video_info.get("fps", 30.0),
+            resolution=video_info.get("resolution", (0, 0)),
+            source=source,
+        )
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.from_dict(data, source=str(path))
+
+    @classmethod
+    def from_jsonl(cls, path):
+        """读取 JSON Lines：首行为 {"video_info": ...}，之后每行一帧。"""
+        frames = []
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                line = line.strip()
+                if line:
+                    frames.append(json.loads(line))
+        return cls.from_dict({"video_info": header.get("video_info", {}), "frames": frames}, source=str(path))
+
+    @classmethod
+    def from_npy(cls, path):
+        """以 mmap 方式读取二进制动作文件，fps 和分辨率来自同名的 .meta.json。"""
+        path = Path(path)
+        with open(path.with_suffix(META_SUFFIX), "r", encoding="utf-8") as f:
+            video_info = json.load(f).get("video_info", {})
+        positions = np.load(path, mmap_mode="r")
+        return cls(positions, video_info.get("fps", 30.0), video_info.get("resolution", (0, 0)), source=str(path))
+
+    @classmethod
+    def from_file(cls, path):
+        """按扩展名解析动作文件（.json / .jsonl / .npy），不使用缓存。"""
+        suffix = Path(path).suffix
+        if suffix == ".jsonl":
+            return cls.from_jsonl(path)
+        if suffix == ".npy":
+            return cls.from_npy(path)
+        return cls.from_json(path)
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        """优先从预编译的 .npy 缓存以 mmap 方式加载，缓存缺失或过期时解析 JSON 并重建缓存。
+
+        .npy 格式的动作文件本身即可 mmap，不经过缓存。
+        """
+        path = Path(path)
+        if not use_cache or path.suffix == ".npy":
+            return cls.from_file(path)
+        meta = _read_cache_meta(path)
+        if meta is None:
+            return compile_clip(path)
+        positions = np.load(_cache_paths(path)[0], mmap_mode="r")
+        return cls(positions, meta["fps"], meta["resolution"], source=str(path))
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes
+
+    def copy(self):
+        return MotionClip(self.positions.copy(), self.fps, self.resolution, self.source, list(self.segments))
+
+    @property
+    def duration(self):
+        """按 fps 播放的时长（秒）。"""
+        return len(self) / self.fps if self.fps > 0 else 0.0
+
+    def sample(self, t, loop=False):
+        """时间 t（秒）处的 (关节数, 2) 姿态，在相邻两帧之间线性插值。
+
+        loop=True 时 t 按时长取模，末帧与首帧之间也做插值；否则 t 被限制在片段范围内。
+        某一侧关节缺失时取较近的一帧。空片段返回全部为 NaN 的姿态。
+        """
+        n = len(self)
+        if n == 0:
+            return np.full((len(JOINT_NAMES), 2), np.nan, dtype=np.float32)
+        pos = t * self.fps
+        if loop:
+            pos %= n
+        else:
+            pos = min(max(pos, 0.0), n - 1)
+        i0 = int(pos)
+        i1 = (i0 + 1) % n if loop else min(i0 + 1, n - 1)
+        frac = np.float32(pos - i0)
+        a, b = self.positions[i0], self.positions[i1]
+        blended = a + (b - a) * frac
+        return np.where(np.isnan(blended), a if frac < 0.5 else b, blended)
+
+    def frame(self, idx):
+        """第 idx 帧的 (关节数, 2) 视图。"""
+        return self.positions[idx]
+
+    def joint(self, name):
+        """某个关节在全部帧上的 (帧数, 2) 视图。"""
+        return self.positions[:, JOINT_INDEX[name]]
+
+    def pelvis(self, idx):
+        x, y = self.positions[idx, PELVIS]
+        if math.isnan(x) or math.isnan(y):
+            return None
+        return float(x), float(y)
+
+    def _writable(self):
+        # mmap 加载的缓存是只读的，首次修改时复制到内存
+        if not self.positions.flags.writeable:
+            self.positions = np.array(self.positions, dtype=np.float32)
+        return self.positions
+
+    def apply_fixups(self, elbow_dy=15, shoulder_gap=30):
+        """素材适配修正：手肘下移 elbow_dy，双肩以中点为基准固定间距 shoulder_gap。"""
+        p = self._writable()
+        p[:, JOINT_INDEX["right_elbow"], 1] += elbow_dy
+        p[:, JOINT_INDEX["left_elbow"], 1] += elbow_dy
+
+        rs = p[:, JOINT_INDEX["right_shoulder"], 0]
+        ls = p[:, JOINT_INDEX["left_shoulder"], 0]
+        both = ~(np.isnan(rs) | np.isnan(ls))
+        mid = (rs + ls) / 2
+        p[:, JOINT_INDEX["right_shoulder"], 0] = np.where(both, mid - shoulder_gap, rs)
+        p[:, JOINT_INDEX["left_shoulder"], 0] = np.where(both, mid, ls)
+        return self
+
+    def translate(self, dx, dy):
+        self._writable()
+        self.positions += np.array([dx, dy], dtype=np.float32)
+        return self
+
+    def center_pelvis(self, cx, cy):
+        """平移整段动作，使首帧骨盆位于 (cx, cy)。首帧没有骨盆时返回 False。"""
+        if not len(self):
+            return False
+        pelvis = self.pelvis(0)
+        if pelvis is None:
+            return False
+        self.translate(cx - pelvis[0], cy - pelvis[1])
+        return True
+
+    @classmethod
+    def stitch(cls, clips, blend_frames=0):
+        """依次拼接多个片段，每段首帧骨盆对齐到上一段末帧骨盆。
+
+        blend_frames > 0 时，每段开头的 blend_frames 帧从上一段末帧姿态渐变过来。
+        """
+        clips = [c for c in clips if len(c)]
+        if not clips:
+            return cls(np.empty((0, len(JOINT_NAMES), 2), dtype=np.float32))
+
+        parts = [clips[0].positions]
+        segments = [(clips[0].source, 0, len(clips[0]))]
+        start = len(clips[0])
+        last_pelvis = clips[0].pelvis(-1)
+        for clip in clips[1:]:
+            positions = clip.positions
+            start_pelvis = clip.pelvis(0)
+            if last_pelvis is not None and start_pelvis is not None:
+                positions = positions + np.array(
+                    [last_pelvis[0] - start_pelvis[0], last_pelvis[1] - start_pelvis[1]],
+                    dtype=np.float32,
+                )
+            else:
+                print(f"[WARN] 动作 {clip.source} 无法与上一段对齐：缺少骨盆关节信息。")
+            if blend_frames > 0:
+                n = min(blend_frames, len(positions))
+                positions = np.array(positions, dtype=np.float32)
+                positions[:n] = crossfade(parts[-1][-1], positions[:n], blend_weights(blend_frames)[:n])
+            parts.append(positions)
+            segments.append((clip.source, start, start + len(clip)))
+            start += len(clip)
+            pelvis = positions[-1, PELVIS]
+            last_pelvis = None if np.isnan(pelvis).any() else (float(pelvis[0]), float(pelvis[1]))
+
+        first = clips[0]
+        return cls(np.concatenate(parts), first.fps, first.resolution, first.source, segments)
+
+
+def smoothstep(t):
+    t = np.clip(t, 0.0, 1.0)
+    return t * t * (3 - 2 * t)
+
+
+def blend_weights(n):
+    """n 帧过渡的混合权重（smoothstep），不含两端的 0 和 1。"""
+    return smoothstep(np.arange(1, n + 1, dtype=np.float32) / (n + 1))
+
+
+def crossfade(from_pose, frames, weights):
+    """把 (关节数, 2) 的起始姿态按 weights 逐帧混合到 (帧数, 关节数, 2) 的 frames 上。
+
+    权重为目标帧所占比例；起始姿态缺失的关节直接取目标帧。
+    """
+    from_pose = np.asarray(from_pose, dtype=np.float32)
+    frames = np.asarray(frames, dtype=np.float32)
+    w = np.asarray(weights, dtype=np.float32)[:, None, None]
+    blended = from_pose + (frames - from_pose) * w
+    return np.where(np.isnan(from_pose), frames, blended)
+
+
+def _cache_paths(json_path):
+    # 以完整文件名为键，foo.json 和 foo.jsonl 各有一份缓存
+    cache_dir = json_path.parent / CACHE_DIR_NAME
+    return cache_dir / f"{json_path.name}.npy", cache_dir / f"{json_path.name}{META_SUFFIX}"
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _replace_atomic(path, write):
+    """先写入同目录下唯一命名的临时文件再替换，多个进程同时编译同一动作时互不干扰。"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        # mkstemp 创建的文件权限为 0600，改成按 umask 的普通权限，其他用户也能读取缓存
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _write_meta(meta_path, meta):
+    _replace_atomic(meta_path, lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8")))
+
+
+def _read_cache_meta(json_path):
+    """返回仍然有效的缓存元数据；mtime/大小变化时再比对内容哈希，不一致则返回 None。"""
+    npy_path, meta_path = _cache_paths(json_path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        st = json_path.stat()
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not npy_path.exists() or meta.get("version") != CACHE_VERSION or meta.get("joints") != JOINT_NAMES:
+        return None
+    if meta.get("mtime_ns") == st.st_mtime_ns and meta.get("size") == st.st_size:
+        return meta
+    if meta.get("sha1") != _file_digest(json_path):
+        return None
+    # 内容未变（例如重新 checkout），刷新时间戳即可继续使用
+    meta["mtime_ns"], meta["size"] = st.st_mtime_ns, st.st_size
+    try:
+        _write_meta(meta_path, meta)
+    except OSError:
+        pass
+    return meta
+
+
+def compile_clip(json_path):
+    """解析动作 JSON / JSON Lines 并写入 .npy 缓存，返回解析得到的 MotionClip。"""
+    json_path = Path(json_path)
+    st = json_path.stat()
+    clip = MotionClip.from_file(json_path)
+
+    npy_path, meta_path = _cache_paths(json_path)
+    try:
+        npy_path.parent.mkdir(exist_ok=True)
+        _replace_atomic(npy_path, lambda f: np.save(f, clip.positions))
+        _write_meta(meta_path, {
+            "version": CACHE_VERSION,
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha1": _file_digest(json_path),
+            "fps": clip.fps,
+            "resolution": list(clip.resolution),
+            "frames": len(clip),
+            "joints": JOINT_NAMES,
+        })
+    except OSError as e:
+        print(f"[WARN] 无法写入动作缓存 {npy_path}: {e}")
+    return clip
+
+
+def compile_actions(action_dir="actions"):
+    """预编译目录下全部动作文件，已是最新的缓存会被跳过。"""
+    compiled = []
+    for json_path in sorted(p for suffix in (".json", ".jsonl") for p in Path(action_dir).glob(f"*{suffix}")
+                            if not p.name.endswith(META_SUFFIX)):
+        if _read_cache_meta(json_path) is None:
+            compile_clip(json_path)
+            compiled.append(json_path.name)
+    return compiled
+
+
+if __name__ == "__main__":
+    action_dir = sys.argv[1] if len(sys.argv) > 1 else "actions"
+    compiled = compile_actions(action_dir)
+    print(f"已编译 {len(compiled)} 个动作文件: {compiled}" if compiled else "动作缓存均为最新。")
@@ -0,0 +1,239 @@
+"""
+动作数据后处理：Savitzky–Golay 时间平滑去除 MediaPipe 的逐帧抖动，再按最大误差抽取关键帧。
+压缩后的动作文件只保存关键帧，MotionClip 加载时线性插值回完整帧序列。
+
+    python motion_filter.py                                   # 只统计 actions/ 下每个动作的压缩率和误差
+    python motion_filter.py --output-dir actions_keyframes    # 写出压缩后的动作文件（.json）
+    python motion_filter.py --window 9 --tolerance 1.0
+
+平滑会改变原始采样数据（快速动作处可达数十像素），默认不允许写回 action_dir；
+确需原位替换时用 --backup-dir 先备份原文件。
+"""
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from motion_clip import CLIP_SUFFIXES, JOINT_NAMES, META_SUFFIX, MotionClip, interpolate_keyframes
+
+SMOOTH_WINDOW = 7   # 平滑窗口帧数（奇数），30 fps 下约 0.23 秒
+SMOOTH_ORDER = 2    # 拟合多项式阶数
+TOLERANCE = 1.5     # 关键帧插值允许的最大关节误差（像素）
+DECIMALS = 2        # 写出坐标保留的小数位
+
+
+def savgol_matrix(window, order):
+    """Savitzky–Golay 投影矩阵：第 k 行是在窗口内第 k 帧处取拟合值的权重。"""
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    a = np.vander(x, order + 1, increasing=True)
+    return a @ np.linalg.pinv(a)
+
+
+def _fill_gaps(positions):
+    """按时间线性插值填补缺失关节，供滤波使用；整段缺失的关节保持 NaN。"""
+    filled = positions.reshape(len(positions), -1).copy()
+    t = np.arange(len(positions))
+    for col in range(filled.shape[1]):
+        missing = np.isnan(filled[:, col])
+        if missing.any() and not missing.all():
+            filled[missing, col] = np.interp(t[missing], t[~missing], filled[~missing, col])
+    return filled.reshape(positions.shape)
+
+
+def savgol(positions, window=SMOOTH_WINDOW, order=SMOOTH_ORDER):
+    """对 (帧数, 关节数, 2) 数组逐关节做 Savitzky–Golay 平滑，首尾各半个窗口用边缘窗口的拟合值。
+
+    片段短于窗口时缩小窗口；缺失的关节在结果中仍为 NaN。
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    n = len(positions)
+    window = min(window, n if n % 2 else n - 1)
+    if window <= order:
+        return positions.copy()
+    half = window // 2
+    h = savgol_matrix(window, order)
+    filled = _fill_gaps(positions).astype(np.float64)
+    windows = sliding_window_view(filled, window, axis=0)  # (帧数 - window + 1, 关节数, 2, window)
+    smoothed = np.concatenate([
+        np.einsum("kw,jcw->kjc", h[:half], windows[0]),
+        windows @ h[half],
+        np.einsum("kw,jcw->kjc", h[half + 1:], windows[-1]),
+    ])
+    return np.where(np.isnan(positions), np.nan, smoothed).astype(np.float32)
+
+
+def frame_errors(a, b):
+    """逐帧的最大关节距离；两边都缺失的关节不计，只有一边缺失视为无穷大。"""
+    dist = np.hypot(*np.moveaxis(a - b, -1, 0))
+    nan_a, nan_b = np.isnan(a).any(axis=-1), np.isnan(b).any(axis=-1)
+    dist = np.where(nan_a & nan_b, 0.0, np.where(nan_a | nan_b, np.inf, dist))
+    return dist.max(axis=-1)
+
+
+def reduce_keyframes(positions, tolerance=TOLERANCE):
+    """贪心选取关键帧：每段尽量延长，直到线性插值的最大关节误差超过 tolerance。
+
+    返回关键帧下标数组，首尾帧总是关键帧。
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    n = len(positions)
+    if n <= 2:
+        return np.arange(n)
+    keys = [0]
+    start = 0
+    end = start + 1
+    while end < n - 1:
+        candidate = end + 1
+        segment = interpolate_keyframes([0, candidate - start], positions[[start, candidate]], candidate - start + 1)
+        if frame_errors(segment, positions[start:candidate + 1]).max() <= tolerance:
+            end = candidate
+            continue
+        keys.append(end)
+        start, end = end, end + 1
+    keys.append(n - 1)
+    return np.array(keys)
+
+
+def compress_clip(clip, window=SMOOTH_WINDOW, order=SMOOTH_ORDER, tolerance=TOLERANCE):
+    """平滑并抽取关键帧，返回 (关键帧下标, 关键帧坐标, 统计)。
+
+    统计中 smooth_* 为平滑相对原始数据的偏移，key_* 为关键帧插值相对平滑结果的误差，
+    total_max_error 为最终回放相对原始数据的最大偏差（像素）。
+    """
+    raw = np.asarray(clip.positions, dtype=np.float32)
+    smoothed = savgol(raw, window, order)
+    frame_numbers = reduce_keyframes(smoothed, tolerance)
+    keys = np.round(smoothed[frame_numbers], DECIMALS)
+    restored = interpolate_keyframes(frame_numbers, keys, len(raw))
+
+    smooth_err = np.hypot(*np.moveaxis(smoothed - raw, -1, 0))
+    key_err = frame_errors(restored, smoothed)
+    stats = {
+        "frames": len(raw),
+        "keyframes": len(frame_numbers),
+        "frame_ratio": len(raw) / len(frame_numbers) if len(frame_numbers) else 0.0,
+        "smooth_mean_error": float(np.nanmean(smooth_err)) if len(raw) else 0.0,
+        "smooth_max_error": float(np.nanmax(smooth_err)) if len(raw) else 0.0,
+        "key_mean_error": float(key_err.mean()) if len(raw) else 0.0,
+        "key_max_error": float(key_err.max()) if len(raw) else 0.0,
+        "total_max_error": float(frame_errors(restored, raw).max()) if len(raw) else 0.0,
+    }
+    return frame_numbers, keys, stats
+
+
+def keyframe_data(clip, frame_numbers, keys, **info):
+    """关键帧动作的 JSON 结构，与采样输出相同，video_info 额外带 keyframes / frame_count。"""
+    frames = []
+    for number, pose in zip(frame_numbers, keys):
+        joints = {
+            name: {"x": float(x), "y": float(y)}
+            for name, (x, y) in zip(JOINT_NAMES, pose.tolist())
+            if not (np.isnan(x) or np.isnan(y))
+        }
+        frames.append({"frame_number": int(number), "timestamp": round(number / clip.fps, 4), "joints": joints})
+    return {
+        "video_info": {
+            "fps": clip.fps,
+            "resolution": list(clip.resolution),
+            "frame_count": len(clip),
+            "keyframes": True,
+            **info,
+        },
+        "frames": frames,
+    }
+
+
+def _load_raw(path):
+    """读取动作文件，已是关键帧格式时返回 None。"""
+    if path.suffix != ".json":
+        return MotionClip.from_file(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("video_info", {}).get("keyframes"):
+        return None
+    return MotionClip.from_dict(data, source=str(path))
+
+
+def process_actions(action_dir="actions", output_dir=None, window=SMOOTH_WINDOW, order=SMOOTH_ORDER,
+                    tolerance=TOLERANCE, backup_dir=None):
+    """处理 action_dir 下的全部动作文件并打印每个片段的压缩率和误差。
+
+    output_dir 为 None 时只统计不写文件；否则写入 output_dir/<名称>.json。
+    output_dir 与 action_dir 相同时必须指定 backup_dir，原文件会先复制过去。
+    已经是关键帧格式的文件会被跳过，避免重复平滑。返回 {名称: 统计}。
+    """
+    action_dir = Path(action_dir)
+    if output_dir is not None and Path(output_dir).resolve() == action_dir.resolve():
+        if backup_dir is None:
+            raise ValueError(f"写回 {action_dir} 会覆盖原始采样数据，请改用其他输出目录或指定备份目录")
+        if Path(backup_dir).resolve() == action_dir.resolve():
+            raise ValueError("备份目录不能与动作目录相同")
+    paths = {}
+    for suffix in reversed(CLIP_SUFFIXES):
+        for path in action_dir.glob(f"*{suffix}"):
+            # 同名文件按 CLIP_SUFFIXES 的查找顺序取第一个
+            if not path.name.endswith(META_SUFFIX):
+                paths[path.stem] = path
+
+    reports = {}
+    print(f"{'动作':<12}{'帧数':>6}{'关键帧':>8}{'压缩比':>8}{'文件大小':>20}"
+          f"{'平滑偏移':>10}{'插值误差':>16}{'总最大误差':>12}")
+    for name, path in sorted(paths.items()):
+        clip = _load_raw(path)
+        if clip is None:
+            print(f"{name:<12}已是关键帧格式，跳过")
+            continue
+        frame_numbers, keys, stats = compress_clip(clip, window, order, tolerance)
+        data = keyframe_data(clip, frame_numbers, keys, smoothing={"window": window, "order": order},
+                             tolerance=tolerance)
+        encoded = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        stats["source_bytes"] = path.stat().st_size
+        stats["bytes"] = len(encoded)
+        reports[name] = stats
+        print(f"{name:<12}{stats['frames']:>6}{stats['keyframes']:>8}{stats['frame_ratio']:>7.1f}x"
+              f"{stats['source_bytes'] / 1024:>10.0f}K ->{stats['bytes'] / 1024:>5.0f}K"
+              f"{stats['smooth_mean_error']:>9.2f}px"
+              f"{stats['key_mean_error']:>7.2f}/{stats['key_max_error']:.2f}px"
+              f"{stats['total_max_error']:>10.2f}px")
+
+        if output_dir is not None:
+            if backup_dir is not None:
+                backup = Path(backup_dir)
+                backup.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(path, backup / path.name)
+                if path.suffix == ".npy":
+                    shutil.copy2(path.with_suffix(META_SUFFIX), backup / path.with_suffix(META_SUFFIX).name)
+            out = Path(output_dir) / f"{name}.json"
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmp = out.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                f.write(encoded)
+            os.replace(tmp, out)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="动作数据平滑与关键帧压缩")
+    parser.add_argument("action_dir", nargs="?", default="actions")
+    parser.add_argument("--output-dir", default=None, help="写出压缩后的动作文件；不指定时只统计")
+    parser.add_argument("--window", type=int, default=SMOOTH_WINDOW, help="平滑窗口帧数（奇数）")
+    parser.add_argument("--order", type=int, default=SMOOTH_ORDER, help="平滑多项式阶数")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="关键帧插值最大误差（像素）")
+    parser.add_argument("--backup-dir", default=None, help="写回动作目录前备份原文件的目录")
+    args = parser.parse_args()
+    if args.window % 2 == 0:
+        parser.error("--window 必须为奇数")
+    try:
+        process_actions(args.action_dir, args.output_dir, args.window, args.order, args.tolerance,
+                        args.backup_dir)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+批量姿态采样：用 MediaPipe Pose 从 input_mp4/*.mp4 提取关节坐标，输出 actions/*.json（或 .jsonl / .npy）。
+
+    python pose_sampler.py                      # input_mp4 下全部视频 -> actions/
+    python pose_sampler.py normal greet -j 4    # 只处理指定视频，4 个进程
+    python pose_sampler.py --force              # 忽略已是最新的输出，全部重新采样
+    python pose_sampler.py --target-fps 15      # 抽帧，输出约 15 fps
+    python pose_sampler.py --format jsonl       # 输出 JSON Lines
+
+多个视频分配到进程池中并行处理，每个进程持有一个 Pose 实例。
+输出文件比视频新时视为已是最新，直接跳过。采样结果逐帧写入 <输出>.part，
+中途崩溃后再次运行会从 .part 中已完成的帧之后继续（.npy 格式除外）。
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+import mediapipe as mp
+
+from clip_writer import FrameWriter
+
+mp_pose = mp.solutions.pose
+
+JOINT_MAPPING = {
+    27: "left_ankle",
+    25: "left_knee",
+    23: "left_hip",
+    24: "right_hip",
+    26: "right_knee",
+    28: "right_ankle",
+    11: "left_shoulder",
+    12: "right_shoulder",
+    13: "left_elbow",
+    14: "right_elbow",
+    15: "left_wrist",
+    16: "right_wrist",
+    0: "nose"
+}
+
+PROGRESS_INTERVAL = 2.0  # 秒，单个视频的进度输出间隔
+FRAME_QUEUE_SIZE = 8     # 解码线程最多领先推理的帧数
+RESUME_WARMUP_FRAMES = 10  # 续写时在断点前重新推理的采样帧数
+
+_END = None
+
+
+def calculate_special_points(landmarks, frame_shape):
+    h, w = frame_shape[:2]
+
+    pelvis_x = (landmarks[23].x + landmarks[24].x) / 2 * w
+    pelvis_y = (landmarks[23].y + landmarks[24].y) / 2 * h
+
+    thorax_x = (landmarks[11].x + landmarks[12].x) / 2 * w
+    thorax_y = (landmarks[11].y + landmarks[12].y) / 2 * h
+
+    upper_neck_x = (thorax_x + landmarks[0].x * w) / 2
+    upper_neck_y = (thorax_y + landmarks[0].y * h) / 2
+
+    head_top_x = landmarks[0].x * w
+    head_top_y = landmarks[0].y * h - 0.125 * h  # 上移12.5%画面高度
+
+    return {
+        "pelvis": (pelvis_x, pelvis_y),
+        "thorax": (thorax_x, thorax_y),
+        "upper_neck": (upper_neck_x, upper_neck_y),
+        "head_top": (head_top_x, head_top_y)
+    }
+
+
+def frame_joints(landmarks, frame_shape, width, height):
+    """一帧的关节字典：MediaPipe 关键点按 JOINT_MAPPING 命名，再加上推算的骨盆、胸、颈、头顶。"""
+    joints = {}
+    for idx, landmark in enumerate(landmarks):
+        if idx in JOINT_MAPPING:
+            joints[JOINT_MAPPING[idx]] = {
+                "x": float(landmark.x * width),
+                "y": float(landmark.y * height),
+                "confidence": 1.0
+            }
+    for point_name, (x, y) in calculate_special_points(landmarks, frame_shape).items():
+        joints[point_name] = {
+            "x": float(x),
+            "y": float(y),
+            "confidence": 1.0
+        }
+    return joints
+
+
+def is_up_to_date(video_path, output_path):
+    output_path = Path(output_path)
+    return output_path.exists() and output_path.stat().st_mtime >= Path(video_path).stat().st_mtime
+
+
+def _put(q, item, stop):
+    # 下游出错退出时不要永久阻塞在已满的队列上
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _decode_frames(cap, stride, start_index, frames, stop, errors):
+    """解码阶段：按 stride 取帧并转成 RGB，放入有界队列；跳过的帧只 grab 不解码到内存。
+
+    续写时 start_index 之前的帧不再送去推理，同样只 grab。
+    """
+    index = 0
+    try:
+        while not stop.is_set():
+            if index % stride or index < start_index:
+                if not cap.grab():
+                    break
+            else:
+                success, frame = cap.read()
+                if not success:
+                    break
+                if not _put(frames, (index, frame.shape, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), stop):
+                    break
+            index += 1
+    except Exception as e:
+        errors.append(e)
+    finally:
+        _put(frames, _END, stop)
+
+
+def _assemble_frames(poses, writer, out_fps, width, height, stop, errors):
+    """组装阶段：把检测到的关键点转成输出帧字典，逐帧交给 writer 写盘。"""
+    try:
+        while True:
+            item = poses.get()
+            if item is _END:
+                break
+            index, landmarks, frame_shape = item
+            frame_count = writer.frames_written
+            writer.write({
+                "frame_number": frame_count,
+                "timestamp": frame_count / out_fps,
+                "source_frame": index,
+                "joints": frame_joints(landmarks, frame_shape, width, height),
+            })
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+
+
+def sample_video(video_path, output_path, pose=None, target_fps=None, resume=True):
+    """采样单个视频并写入 output_path（格式由扩展名决定），返回帧数、耗时和吞吐统计。
+
+    解码、姿态推理、结果组装分三个阶段流水线执行：解码线程填充有界帧队列，当前线程推理，
+    组装线程生成输出帧并逐帧写盘。target_fps 低于视频帧率时按整数步长抽帧，输出的 fps 随之降低。
+    resume=True 时从上次中断留下的 .part 文件继续。
+    pose 为 None 时临时创建一个 Pose 实例；批量处理时由调用方复用。
+    """
+    video_path, output_path = Path(video_path), Path(output_path)
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise IOError(f"无法打开视频: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    stride = max(1, round(fps / target_fps)) if target_fps else 1
+    out_fps = fps / stride
+
+    video_info = {
+        "fps": float(out_fps),
+        "total_frames": total_frames,
+        "resolution": [height, width],
+        "frame_stride": stride,
+        # 续写时用来确认 .part 文件来自同一个视频
+        "source": video_path.name,
+        "source_mtime_ns": video_path.stat().st_mtime_ns,
+        "complete": False
+    }
+    try:
+        writer = FrameWriter(output_path, video_info, resume=resume)
+    except Exception:
+        cap.release()
+        raise
+    resume_index = writer.next_source_frame
+    # MediaPipe 在视频中途冷启动时常常检测不到人，续写前先重新推理几帧恢复跟踪状态，结果不写出
+    start_index = max(0, resume_index - RESUME_WARMUP_FRAMES * stride)
+    if resume_index:
+        print(f"[{video_path.stem}] 从第 {resume_index} 帧继续（已有 {writer.frames_written} 帧）")
+
+    own_pose = pose is None
+    if own_pose:
+        pose = mp_pose.Pose()
+    else:
+        # 跟踪状态不应从上一个视频延续过来
+        pose.reset()
+
+    name = video_path.stem
+    stop = threading.Event()
+    errors = []
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    poses = queue.Queue()
+    decoder = threading.Thread(target=_decode_frames, args=(cap, stride, start_index, frames, stop, errors),
+                               name=f"decode-{name}", daemon=True)
+    assembler = threading.Thread(target=_assemble_frames,
+                                 args=(poses, writer, out_fps, width, height, stop, errors),
+                                 name=f"assemble-{name}", daemon=True)
+
+    start = last_report = time.perf_counter()
+    decoded = 0
+    processed = 0
+    inference_seconds = 0.0
+    decoder.start()
+    assembler.start()
+    try:
+        while not stop.is_set():
+            try:
+                item = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            index, frame_shape, rgb = item
+            decoded = index + 1
+
+            t0 = time.perf_counter()
+            results = pose.process(rgb)
+            inference_seconds += time.perf_counter() - t0
+            processed += 1
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"[{name}] {decoded}/{total_frames} 帧, {processed / (now - start):.1f} fps")
+
+            if results.pose_landmarks and index >= resume_index:
+                poses.put((index, results.pose_landmarks.landmark, frame_shape))
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        poses.put(_END)
+        decoder.join()
+        assembler.join()
+        cap.release()
+        if own_pose:
+            pose.close()
+        if stop.is_set() or errors:
+            # 保留 .part，下次运行时续写
+            writer.abort()
+    if errors:
+        raise errors[0]
+    writer.close(complete=True, frame_count=writer.frames_written)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "video": str(video_path),
+        "output": str(output_path),
+        "decoded_frames": decoded,
+        "processed_frames": processed,
+        "pose_frames": writer.frames_written,
+        "frame_stride": stride,
+        "seconds": elapsed,
+        "fps": processed / elapsed if elapsed else 0.0,
+        # 仅推理耗时对应的吞吐上限，用于衡量流水线的重叠程度
+        "inference_fps": processed / inference_seconds if inference_seconds else 0.0,
+    }
+
+
+# 每个工作进程一个 Pose 实例，处理多个视频时复用
+_worker_pose = None
+
+
+def _init_worker():
+    global _worker_pose
+    _worker_pose = mp_pose.Pose()
+
+
+def _sample_in_worker(video_path, output_path, target_fps, resume):
+    return sample_video(video_path, output_path, pose=_worker_pose, target_fps=target_fps, resume=resume)
+
+
+def sample_directory(input_dir="input_mp4", output_dir="actions", names=None, workers=None, force=False,
+                     target_fps=None, fmt="json"):
+    """并行采样 input_dir 下的 *.mp4（或 names 指定的视频），输出到 output_dir/<视频名>.<fmt>。
+
+    返回成功完成的视频统计列表；已是最新的输出会被跳过，未完成的 .part 会被续写（force=True 时都不做）。
+    """
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    if names:
+        videos = [input_dir / f"{Path(n).stem}.mp4" for n in names]
+    else:
+        videos = sorted(input_dir.glob("*.mp4"))
+
+    jobs = []
+    for video in videos:
+        output = output_dir / f"{video.stem}.{fmt}"
+        if not video.exists():
+            print(f"[警告] 视频不存在，跳过: {video}")
+        elif not force and is_up_to_date(video, output):
+            print(f"[跳过] {output} 已是最新")
+        else:
+            jobs.append((video, output))
+    if not jobs:
+        print("没有需要采样的视频。")
+        return []
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    print(f"开始采样 {len(jobs)} 个视频，{workers} 个进程...")
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(_sample_in_worker, video, output, target_fps, not force): video for video, output in jobs}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[错误] 采样 {video} 失败: {e}")
+                continue
+            results.append(result)
+            print(f"[完成 {len(results)}/{len(jobs)}] {video.name}: {result['pose_frames']}/{result['processed_frames']} 帧有姿态, "
+                  f"{result['seconds']:.1f} 秒, {result['fps']:.1f} fps（推理上限 {result['inference_fps']:.1f} fps）"
+                  f" -> {result['output']}")
+
+    elapsed = time.perf_counter() - start
+    total = sum(r["processed_frames"] for r in results)
+    print(f"全部完成：{total} 帧，耗时 {elapsed:.1f} 秒，总吞吐 {total / elapsed:.1f} fps")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量从视频中采样皮影动作关节数据")
+    parser.add_argument("videos", nargs="*", help="视频名（不含扩展名），默认为输入目录下全部 mp4")
+    parser.add_argument("--input-dir", default="input_mp4")
+    parser.add_argument("--output-dir", default="actions")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数，默认为 CPU 核数")
+    parser.add_argument("--force", action="store_true", help="重新采样已是最新的输出")
+    parser.add_argument("--target-fps", type=float, default=None, help="按整数步长抽帧，使输出接近该帧率")
+    parser.add_argument("--format", choices=("json", "jsonl", "npy"), default="json")
+    args = parser.parse_args()
+    sample_directory(args.input_dir, args.output_dir, args.videos, args.workers, args.force,
+                     args.target_fps, args.format)
+
+
+if __name__ == "__main__":
+    main()
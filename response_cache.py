@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List, Optional, Tuple
+
+from intent_matcher import has_negation
+
+
+def normalize_input(text: str) -> str:
+    """统一全角/半角与大小写，去掉空白和标点，使 "你是谁？" 与 "你是谁" 命中同一条缓存。"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZC")
+
+
+def char_ngrams(text: str, n: int = 2) -> set:
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class ResponseCache:
+    """以规范化输入为键、保存在 SQLite 中的 (动作, 回复) 缓存。
+
+    条目超过 ttl 秒后失效；条目数超过 max_entries 时淘汰最久未使用的条目。
+    设置 fuzzy_threshold 后，精确未命中时按字符 n-gram 的 Dice 相似度做近似匹配。
+    含否定词（见 intent_matcher.NEGATIONS）的输入既不查询也不写入缓存："不要跳舞" 与 "跳舞" 只差两个字，
+    却是相反的意思。
+    """
+
+    def __init__(self, path: str = "response_cache.db", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 500, fuzzy_threshold: Optional[float] = None, ngram: int = 2):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.fuzzy_threshold = fuzzy_threshold
+        self.ngram = ngram
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   actions TEXT NOT NULL,
+                   reply TEXT NOT NULL,
+                   created REAL NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+        self._ngrams = {}
+        if fuzzy_threshold is not None:
+            for (key,) in self._conn.execute("SELECT key FROM responses"):
+                self._ngrams[key] = char_ngrams(key, ngram)
+
+    def get(self, user_input: str) -> Optional[Tuple[List[str], str]]:
+        key = normalize_input(user_input)
+        if not key:
+            return None
+        if has_negation(key):
+            self.bypassed += 1
+            return None
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            row = self._conn.execute(
+                "SELECT key, actions, reply FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            fuzzy = False
+            if row is None and self.fuzzy_threshold is not None:
+                match = self._fuzzy_match(key)
+                if match is not None:
+                    row = self._conn.execute(
+                        "SELECT key, actions, reply FROM responses WHERE key = ?", (match,)
+                    ).fetchone()
+                    fuzzy = row is not None
+                    if row is None:
+                        # 已因过期被删除
+                        self._ngrams.pop(match, None)
+            if row is None:
+                self.misses += 1
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            self.hits += 1
+            if fuzzy:
+                self.fuzzy_hits += 1
+        return json.loads(row[1]), row[2]
+
+    def put(self, user_input: str, actions: List[str], reply: str):
+        key = normalize_input(user_input)
+        if not key or has_negation(key):
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, actions, reply, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(actions, ensure_ascii=False), reply, now, now),
+            )
+            evicted = self._conn.execute(
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self._conn.commit()
+            if self.fuzzy_threshold is not None:
+                self._ngrams[key] = char_ngrams(key, self.ngram)
+                for (old,) in evicted:
+                    self._ngrams.pop(old, None)
+
+    def _fuzzy_match(self, key: str) -> Optional[str]:
+        grams = char_ngrams(key, self.ngram)
+        best, best_score = None, self.fuzzy_threshold
+        for candidate, cand_grams in self._ngrams.items():
+            total = len(grams) + len(cand_grams)
+            if not total:
+                continue
+            score = 2 * len(grams & cand_grams) / total
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
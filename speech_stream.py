@@ -0,0 +1,213 @@
+import collections
+import json
+import math
+import queue
+import threading
+
+import numpy as np
+from vosk import KaldiRecognizer
+
+
+class StreamingRecognizer:
+    """录音期间逐块识别：音频回调把数据块放入有界队列，工作线程实时喂给 Vosk。
+
+    on_partial(text) 在识别出新的部分结果时调用；finish() 之后工作线程取出剩余数据块，
+    调用 on_final(text) 给出完整结果。回调都在工作线程中执行。
+    """
+
+    _FINISH = object()
+
+    def __init__(self, model, sample_rate, on_partial=None, on_final=None, max_blocks=64):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.dropped_blocks = 0
+        self._blocks = queue.Queue(maxsize=max_blocks)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="StreamingRecognizer", daemon=True)
+        self._thread.start()
+        return self
+
+    def feed(self, block):
+        """由音频回调调用，不阻塞；队列已满时丢弃该数据块。"""
+        try:
+            self._blocks.put_nowait(block)
+        except queue.Full:
+            self.dropped_blocks += 1
+
+    def finish(self):
+        """录音结束，通知工作线程输出最终结果。"""
+        self._blocks.put(self._FINISH)
+
+    def _run(self):
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+        segments = []
+        last_partial = ""
+        while True:
+            block = self._blocks.get()
+            if block is self._FINISH:
+                break
+            if recognizer.AcceptWaveform(block.tobytes()):
+                text = json.loads(recognizer.Result()).get("text", "").strip()
+                if text:
+                    segments.append(text)
+                partial = ""
+            else:
+                partial = json.loads(recognizer.PartialResult()).get("partial", "").strip()
+            current = " ".join(segments + ([partial] if partial else []))
+            if current and current != last_partial and self.on_partial:
+                last_partial = current
+                self.on_partial(current)
+
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if text:
+            segments.append(text)
+        if self.dropped_blocks:
+            print(f"[录音警告] 识别队列已满，丢弃了 {self.dropped_blocks} 个音频块。")
+        if self.on_final:
+            self.on_final(" ".join(segments))
+
+
+class EnergyEndpointer:
+    """基于能量的语音端点检测，以录音数据块为单位判断一句话的开始和结束。
+
+    噪声基底在静音段上做指数平滑；能量高于基底 threshold_db 且高于 min_level_db 视为语音。
+    连续 start_blocks 个语音块判定开始，连续 hangover_blocks 个静音块判定结束。
+    process() 返回事件列表：("start", [预录数据块...])、("speech", 数据块)、("end", None)。
+    """
+
+    def __init__(self, threshold_db=10.0, min_level_db=-50.0, start_blocks=1,
+                 hangover_blocks=3, preroll_blocks=1, max_blocks=120, floor_alpha=0.05):
+        self.threshold_db = threshold_db
+        self.min_level_db = min_level_db
+        self.start_blocks = start_blocks
+        self.hangover_blocks = hangover_blocks
+        self.max_blocks = max_blocks
+        self.floor_alpha = floor_alpha
+        self.noise_floor_db = None
+        self.in_speech = False
+        self.total_blocks = 0
+        self.speech_blocks = 0
+        self._pending = collections.deque(maxlen=preroll_blocks + start_blocks)
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._utterance_blocks = 0
+
+    @staticmethod
+    def level_db(block):
+        """int16 数据块的 RMS 电平（dBFS）。"""
+        samples = block.astype(np.float32) / 32768.0
+        rms = math.sqrt(float(np.mean(samples * samples))) if samples.size else 0.0
+        return 20 * math.log10(rms) if rms > 1e-9 else -180.0
+
+    def _is_voiced(self, level):
+        if self.noise_floor_db is None:
+            self.noise_floor_db = level
+        voiced = level > self.min_level_db and level > self.noise_floor_db + self.threshold_db
+        if not voiced and not self.in_speech:
+            self.noise_floor_db += self.floor_alpha * (level - self.noise_floor_db)
+        return voiced
+
+    @property
+    def skipped_blocks(self):
+        """未送入识别器的静音数据块数。"""
+        return self.total_blocks - self.speech_blocks
+
+    def process(self, block):
+        self.total_blocks += 1
+        voiced = self._is_voiced(self.level_db(block))
+        events = []
+        if not self.in_speech:
+            self._pending.append(block)
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.start_blocks:
+                self.in_speech = True
+                self._silent_run = 0
+                self._utterance_blocks = len(self._pending)
+                self.speech_blocks += len(self._pending)
+                events.append(("start", list(self._pending)))
+                self._pending.clear()
+            return events
+
+        events.append(("speech", block))
+        self.speech_blocks += 1
+        self._utterance_blocks += 1
+        self._silent_run = 0 if voiced else self._silent_run + 1
+        if self._silent_run >= self.hangover_blocks or self._utterance_blocks >= self.max_blocks:
+            self.in_speech = False
+            self._voiced_run = 0
+            events.append(("end", None))
+        return events
+
+
+class HandsFreeListener:
+    """免提监听：持续接收录音数据块，由端点检测切分语句，只把语音段送给 Vosk。
+
+    feed() 由音频回调调用；端点检测和识别器管理在独立线程中完成。
+    每句话识别完成后调用 on_utterance(text)。
+    """
+
+    def __init__(self, model, sample_rate, on_partial=None, on_utterance=None,
+                 endpointer=None, max_blocks=64):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.on_partial = on_partial
+        self.on_utterance = on_utterance
+        self.endpointer = endpointer or EnergyEndpointer()
+        self.dropped_blocks = 0
+        self._blocks = queue.Queue(maxsize=max_blocks)
+        self._thread = None
+
+    @property
+    def in_speech(self):
+        return self.endpointer.in_speech
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="HandsFreeListener", daemon=True)
+        self._thread.start()
+        return self
+
+    def feed(self, block):
+        try:
+            self._blocks.put_nowait(block)
+        except queue.Full:
+            self.dropped_blocks += 1
+
+    def stop(self):
+        self._blocks.put(None)
+
+    def _run(self):
+        recognizer = None
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                break
+            for kind, value in self.endpointer.process(block):
+                if kind == "start":
+                    recognizer = StreamingRecognizer(
+                        self.model, self.sample_rate,
+                        on_partial=self.on_partial, on_final=self._on_final,
+                    ).start()
+                    for pre in value:
+                        recognizer.feed(pre)
+                elif kind == "speech":
+                    recognizer.feed(value)
+                elif kind == "end":
+                    recognizer.finish()
+                    recognizer = None
+        if recognizer is not None:
+            recognizer.finish()
+
+    def _on_final(self, text):
+        if text and self.on_utterance:
+            self.on_utterance(text)
+
+    def stats(self):
+        return {
+            "speech_blocks": self.endpointer.speech_blocks,
+            "skipped_blocks": self.endpointer.skipped_blocks,
+            "dropped_blocks": self.dropped_blocks,
+        }